@@ -6,13 +6,405 @@
 import sys
 import h5py
 import numpy as np
-from PyQt6.QtWidgets import QApplication, QMainWindow, QPushButton, QLabel, QVBoxLayout, QWidget, QFileDialog, QSlider, QDockWidget, QTabWidget, QTableWidget, QTableWidgetItem, QMessageBox, QHeaderView, QSizePolicy, QHBoxLayout, QProgressDialog, QInputDialog, QCheckBox, QTreeWidget, QTreeWidgetItem, QDialog, QDialogButtonBox, QSplitter
-from PyQt6.QtGui import QImage, QPixmap, QIcon, QColor
-from PyQt6.QtCore import QTimer, Qt, QSize
+from PyQt6.QtWidgets import QApplication, QMainWindow, QPushButton, QLabel, QVBoxLayout, QWidget, QFileDialog, QSlider, QDockWidget, QTabWidget, QTableWidget, QTableWidgetItem, QMessageBox, QHeaderView, QSizePolicy, QHBoxLayout, QProgressDialog, QInputDialog, QCheckBox, QTreeWidget, QTreeWidgetItem, QDialog, QDialogButtonBox, QSplitter, QGridLayout, QComboBox, QSpinBox, QLineEdit
+from PyQt6.QtGui import QImage, QPixmap, QIcon, QColor, QPainter, QPen, QPalette
+from PyQt6.QtCore import QTimer, Qt, QSize, QPoint, QPointF, QRectF, pyqtSignal
 import pyqtgraph as pg
-import cv2
 import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import pyqtgraph.opengl as gl
+import robros_core
+import robros_stats
+import robros_qc
+import robros_search
+
+MAX_TRAJECTORY_POINTS = 2000
+MAX_CACHED_PYRAMIDS = 32
+DEFAULT_PLAYBACK_RATE = 30.0
+PLAYBACK_SPEEDS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0)
+MAX_STRIP_THUMBNAILS = 200
+SEARCH_MODES = (
+    ("Frames with a similar pose", 'pose'),
+    ("Frames that look similar", 'image'),
+    ("Episodes with a similar trajectory", 'trajectory'),
+    ("Episodes that start similarly", 'start'),
+)
+
+PROFILER = robros_core.StageProfiler()
+
+def array_image(image_cv):
+    ## Wraps an RGB array without copying. QImage does not own external data, so the array rides along on the Python
+    ## wrapper and lives exactly as long as the image; such images must not be handed to C++ code that keeps them.
+    image = QImage(image_cv, image_cv.shape[1], image_cv.shape[0], image_cv.strides[0], QImage.Format.Format_RGB888)
+    image.buffer = image_cv
+    return image
+
+def decode_frame(dataset, frame_index, reduction=1):
+    with PROFILER.stage('read'):
+        blob = dataset[frame_index]
+    with PROFILER.stage('decode'):
+        image_cv = robros_core.decode_image(blob, reduction, rgb=True)
+    with PROFILER.stage('qimage'):
+        image = array_image(image_cv)
+    return image
+
+def decode_frame_or_none(dataset, frame_index, reduction=1):
+    ## Corrupt or truncated frames come back as None, the caller shows a placeholder instead
+    try:
+        return decode_frame(dataset, frame_index, reduction)
+    except Exception:
+        return None
+
+class FrameCache:
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.frames = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            image = self.frames.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def contains(self, key):
+        with self.lock:
+            return key in self.frames
+
+    def put(self, key, image):
+        size = image.sizeInBytes()
+        with self.lock:
+            if key in self.frames:
+                self.total_bytes -= self.frames.pop(key).sizeInBytes()
+            if size > self.max_bytes:
+                return
+            self.frames[key] = image
+            self.total_bytes += size
+            self._evict()
+
+    def set_max_bytes(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.total_bytes = 0
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.frames:
+            _, image = self.frames.popitem(last=False)
+            self.total_bytes -= image.sizeInBytes()
+
+class FramePrefetcher:
+    ## Streams are {name: (dataset, cache_key, reduction)}, e.g. one per camera shown on screen
+    def __init__(self, cache=None, depth=32, workers=4):
+        self.cache = cache
+        self.depth = depth
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.fetch_executor = ThreadPoolExecutor(max_workers=8)
+        self.lock = threading.Lock()
+        self.streams = {}
+        self.generation = 0
+        self.window = set()
+        self.ready = {}
+        self.pending = {}
+
+    def set_streams(self, streams):
+        with self.lock:
+            self.streams = dict(streams)
+            self.generation += 1
+            self.window = set()
+            self.ready.clear()
+            for _, future in self.pending.values():
+                future.cancel()
+            self.pending.clear()
+
+    def request(self, frame_index, direction=1, stride=1):
+        ## Keep the next `depth` frames of every stream in the play direction decoded, drop everything else;
+        ## `stride` is how far playback moves per tick, so fast playback decodes the frames it will actually show
+        with self.lock:
+            window = []
+            for name, (dataset, _, _) in self.streams.items():
+                num_frames = dataset.shape[0]
+                if num_frames < 2:
+                    continue
+                indices = ((frame_index + i * direction * stride) % num_frames for i in range(1, min(self.depth, num_frames - 1) + 1))
+                window += [(name, index) for index in dict.fromkeys(indices) if index != frame_index]
+            self.window = set(window)
+
+            for key in list(self.pending):
+                if key not in self.window:
+                    self.pending.pop(key)[1].cancel()
+            for key in list(self.ready):
+                if key not in self.window:
+                    del self.ready[key]
+
+            for key in window:
+                name, index = key
+                dataset, cache_key, reduction = self.streams[name]
+                if self.cache is not None and self.cache.contains(cache_key + (index,)):
+                    continue
+                if key not in self.ready and key not in self.pending:
+                    token = object()
+                    future = self.executor.submit(self._decode, self.generation, token, dataset, reduction, key)
+                    self.pending[key] = (token, future)
+
+    def take(self, name, frame_index):
+        with self.lock:
+            return self.ready.pop((name, frame_index), None)
+
+    def is_pending(self, frame_index):
+        with self.lock:
+            return any((name, frame_index) in self.pending for name in self.streams)
+
+    def is_ready(self, frame_index):
+        with self.lock:
+            return self._is_ready(frame_index)
+
+    def newest_ready(self, frame_index, step, num_frames):
+        ## Offset of the decoded frame furthest along the `step` frames after `frame_index`, or None if none is ready yet
+        direction = 1 if step > 0 else -1
+        with self.lock:
+            for offset in range(abs(step), 0, -1):
+                if self._is_ready((frame_index + offset * direction) % num_frames):
+                    return offset * direction
+        return None
+
+    def _is_ready(self, frame_index):
+        ## Every stream has the frame decoded, either waiting in `ready` or already in the frame cache
+        return all((name, frame_index) in self.ready or (self.cache is not None and self.cache.contains(cache_key + (frame_index,)))
+                   for name, (_, cache_key, _) in self.streams.items())
+
+    def fetch(self, frame_index, names):
+        ## Decode one frame per stream concurrently, so the wait is bounded by the slowest camera; failures come back as None
+        with self.lock:
+            streams = {name: self.streams[name] for name in names}
+        if len(streams) == 1:
+            name, (dataset, _, reduction) = next(iter(streams.items()))
+            return {name: decode_frame_or_none(dataset, frame_index, reduction)}
+        futures = {name: self.fetch_executor.submit(decode_frame_or_none, dataset, frame_index, reduction) for name, (dataset, _, reduction) in streams.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    def shutdown(self):
+        self.set_streams({})
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.fetch_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _decode(self, generation, token, dataset, reduction, key):
+        image = decode_frame_or_none(dataset, key[1], reduction)
+
+        with self.lock:
+            if generation != self.generation or self.pending.get(key, (None,))[0] is not token:
+                return
+            del self.pending[key]
+            if image is not None:
+                self.ready[key] = image
+
+def thumbnail_image(blob):
+    return array_image(robros_core.decode_image(blob, rgb=True))
+
+class FrameView(QWidget):
+    ## Paints the decoded QImage scaled straight into the widget, instead of building a scaled pixmap for a QLabel every frame
+    resized = pyqtSignal()
+
+    def __init__(self, text="No Image Loaded", parent=None):
+        super().__init__(parent)
+        self.image = None
+        self.text = text
+        self.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
+
+    def set_image(self, image):
+        self.image = image
+        self.text = None
+        self.update()
+
+    def set_text(self, text):
+        self.image = None
+        self.text = text
+        self.update()
+
+    def target_rect(self):
+        ## Where the image lands with KeepAspectRatio, centred like the QLabel it replaces
+        if self.image is None:
+            return QRectF()
+        size = self.image.size().scaled(self.size(), Qt.AspectRatioMode.KeepAspectRatio)
+        return QRectF((self.width() - size.width()) / 2, (self.height() - size.height()) / 2, size.width(), size.height())
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        if self.image is not None:
+            with PROFILER.stage('draw'):
+                painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+                painter.drawImage(self.target_rect(), self.image)
+        elif self.text:
+            painter.setPen(self.palette().color(QPalette.ColorRole.WindowText))
+            painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, self.text)
+        painter.end()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.resized.emit()
+
+class ThumbnailStore:
+    ## Thumbnails per (file, camera) as {frame: QImage}, read from the sidecar cache or decoded in a background pool.
+    ## New thumbnails are written back to the cache in the pool once every chunk requested for that key has finished;
+    ## only the QImage merge runs on the GUI thread.
+    def __init__(self, workers=2, chunk_frames=16):
+        self.chunk_frames = chunk_frames
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.images = {}
+        self.futures = {}
+        self.made = {}
+        self.saves = {}
+
+    def request(self, file_name, camera, frames):
+        key = (file_name, camera)
+        images = self.images.setdefault(key, {})
+        futures = self.futures.setdefault(key, {})
+        queued = set().union(*futures.values()) if futures else set()
+        missing = [frame for frame in frames if frame not in images and frame not in queued]
+        for offset in range(0, len(missing), self.chunk_frames):
+            chunk = tuple(missing[offset:offset + self.chunk_frames])
+            futures[self.executor.submit(self._fetch, file_name, camera, chunk)] = chunk
+        return images
+
+    def pending(self):
+        return any(self.futures.values()) or any(self.made.values())
+
+    def poll(self):
+        ## Collect finished chunks on the GUI thread, returns the keys that got new images
+        updated = set()
+        for key, futures in list(self.futures.items()):
+            for future in [future for future in futures if future.done()]:
+                del futures[future]
+                if future.cancelled():
+                    continue
+                try:
+                    images, made = future.result()
+                except Exception:
+                    continue
+                self.images.setdefault(key, {}).update(images)
+                self.made.setdefault(key, {}).update(made)
+                updated.add(key)
+
+            if not futures:
+                del self.futures[key]
+
+        for key in [key for key, made in self.made.items() if made and key not in self.futures]:
+            ## One write per key at a time, so two writes never merge over each other; a later one waits for the next poll
+            if key in self.saves and not self.saves[key].done():
+                continue
+            self.saves[key] = self.executor.submit(robros_core.save_thumbnails, *key, self.made.pop(key))
+        self.saves = {key: future for key, future in self.saves.items() if not future.done()}
+        return updated
+
+    def cancel(self, key):
+        for future in self.futures.get(key, {}):
+            future.cancel()
+
+    def release(self, key, keep=(0,)):
+        ## Drop a strip that is no longer shown, keeping the frames the file list still uses
+        for future, chunk in self.futures.get(key, {}).items():
+            if not set(chunk) & set(keep):
+                future.cancel()
+        images = self.images.get(key)
+        if images is not None:
+            self.images[key] = {frame: image for frame, image in images.items() if frame in keep}
+
+    def forget(self, file_name):
+        ## The episode was rewritten, so anything decoded or still in flight for it is stale
+        for key in [key for key in set(self.images) | set(self.futures) if key[0] == file_name]:
+            self.cancel(key)
+            self.images.pop(key, None)
+            self.futures.pop(key, None)
+            self.made.pop(key, None)
+            if key in self.saves:
+                self.saves.pop(key).cancel()
+
+    def shutdown(self):
+        ## Drop the decodes still queued but let the cache writes finish
+        for key in list(self.futures):
+            self.cancel(key)
+        self.executor.shutdown(wait=False)
+
+    def _fetch(self, file_name, camera, frames):
+        cached = robros_core.load_thumbnails(file_name, camera, frames)
+        made = robros_core.make_thumbnails(file_name, camera, [frame for frame in frames if frame not in cached])
+        images = {frame: thumbnail_image(blob) for frame, blob in {**cached, **made}.items()}
+        return images, made
+
+class RankedItem(QTableWidgetItem):
+    ## Sorts by the rank stored in UserRole instead of the text, e.g. QC severity
+    def __lt__(self, other):
+        return (self.data(Qt.ItemDataRole.UserRole) or 0) < (other.data(Qt.ItemDataRole.UserRole) or 0)
+
+class FilmStrip(QWidget):
+    ## Keyframe thumbnails laid out under the timeline: each slot shows the keyframe nearest the frame it covers
+    frame_clicked = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.thumbnails = {}
+        self.step = 1
+        self.view = (0.0, 1.0, 0, 1)
+        self.current_frame = 0
+        self.setFixedHeight(56)
+
+    def set_thumbnails(self, thumbnails, step):
+        self.thumbnails = thumbnails
+        self.step = max(1, step)
+        self.update()
+
+    def set_view(self, first_frame, last_frame, left, right):
+        ## Frames first_frame..last_frame span pixels left..right, matching the plot above
+        self.view = (first_frame, last_frame, left, right)
+        self.update()
+
+    def set_current_frame(self, frame_index):
+        self.current_frame = frame_index
+        self.update()
+
+    def frame_at(self, x):
+        first_frame, last_frame, left, right = self.view
+        return int(round(first_frame + (x - left) * (last_frame - first_frame) / max(1, right - left)))
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(32, 32, 32))
+        first_frame, last_frame, left, right = self.view
+        if last_frame <= first_frame or right <= left:
+            return
+
+        painter.setClipRect(left, 0, right - left, self.height())
+        sample = next(iter(self.thumbnails.values()), None)
+        if sample is not None:
+            height = self.height()
+            width = max(8, sample.width() * height // max(1, sample.height()))
+            for x in range(left, right, width):
+                frame = self.frame_at(x + width / 2)
+                image = self.thumbnails.get(int(round(frame / self.step)) * self.step)
+                if image is not None:
+                    painter.drawImage(QRectF(x, 0, width, height), image)
+
+        x = left + (self.current_frame - first_frame) * (right - left) / (last_frame - first_frame)
+        painter.setPen(QPen(QColor('red'), 2))
+        painter.drawLine(QPointF(x, 0), QPointF(x, self.height()))
+
+    def mousePressEvent(self, event):
+        self.frame_clicked.emit(self.frame_at(event.position().x()))
 
 class HDF5Viewer(QMainWindow):
     def __init__(self):
@@ -37,12 +429,43 @@ class HDF5Viewer(QMainWindow):
 
         self.current_frame = 0
         self.timer = QTimer()
+        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
         self.timer.timeout.connect(self.next_frame)
+        self.play_direction = 1
+        self.playback_clock = robros_core.PlaybackClock(DEFAULT_PLAYBACK_RATE)
+        self.playback_position = 0
+        self.frame_cache = FrameCache()
+        self.prefetcher = FramePrefetcher(self.frame_cache)
 
         self.hdf5_files = []
+        self.episode_info = {}
+        self.mark_in = None
+        self.mark_out = None
+        self.split_points = []
+        self.images_dict = {}
+        self.grid_mode = False
+        self.grid_labels = {}
+        self.image_shapes = {}
         self.should_plot_reward = False
         self.xpos_data = None
         self.gl_widget = None
+        self.scatter_item = None
+        self.trail_item = None
+        self.trail_length = 0
+        self.signal_data = None
+        self.signal_key = None
+        self.signal_curve = None
+        self.pyramids = OrderedDict()
+        self.pyramid_futures = {}
+        self.pyramid_executor = ThreadPoolExecutor(max_workers=1)
+        self.thumbnails = ThumbnailStore()
+        self.thumbnail_interval = 0
+        self.filmstrip_key = None
+        self.contact_cameras = {}
+        self.thumbnail_poll_scheduled = False
+        self.search_index = None
+        self.search_dialog = None
+        self.resize_check_scheduled = False
         self.initUI()
 
     def initUI(self):
@@ -69,9 +492,11 @@ class HDF5Viewer(QMainWindow):
         dock_layout.setSpacing(0)
 
         self.file_table_widget = QTableWidget()
-        self.file_table_widget.setColumnCount(2)
-        self.file_table_widget.setHorizontalHeaderLabels(["File Name", "Data Count"])
+        self.file_table_widget.setColumnCount(3)
+        self.file_table_widget.setHorizontalHeaderLabels(["File Name", "Data Count", "QC"])
+        self.file_table_widget.setSortingEnabled(True)
         self.file_table_widget.cellClicked.connect(self.load_selected_hdf5)
+        self.file_table_widget.setIconSize(QSize(64, 48))
         
         header = self.file_table_widget.horizontalHeader()
         header.setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
@@ -82,6 +507,10 @@ class HDF5Viewer(QMainWindow):
         self.load_button.clicked.connect(self.load_hdf5)
         dock_layout.addWidget(self.load_button)
 
+        self.load_directory_button = QPushButton("Load HDF5 Directory")
+        self.load_directory_button.clicked.connect(self.load_hdf5_directory)
+        dock_layout.addWidget(self.load_directory_button)
+
         self.dock.setWidget(dock_widget_content)
 
         self.addDockWidget(Qt.DockWidgetArea.LeftDockWidgetArea, self.dock)
@@ -94,11 +523,53 @@ class HDF5Viewer(QMainWindow):
         file_menu = menu_bar.addMenu("File")
         load_hdf5_action = file_menu.addAction("Load HDF5 File")
         load_hdf5_action.triggered.connect(self.load_hdf5)
+        load_directory_action = file_menu.addAction("Load HDF5 Directory")
+        load_directory_action.triggered.connect(self.load_hdf5_directory)
         save_hdf5_action = file_menu.addAction("Save HDF5 File")
         save_hdf5_action.triggered.connect(self.save_hdf5)
+        export_trimmed_action = file_menu.addAction("Export Trimmed Episode")
+        export_trimmed_action.triggered.connect(self.export_trimmed)
+        export_split_action = file_menu.addAction("Export Split Episodes")
+        export_split_action.triggered.connect(self.export_split)
+        quality_check_action = file_menu.addAction("Quality Check Files")
+        quality_check_action.triggered.connect(self.quality_check_files)
+        dataset_stats_action = file_menu.addAction("Dataset Statistics")
+        dataset_stats_action.triggered.connect(self.show_dataset_stats)
+        search_action = file_menu.addAction("Search Similar")
+        search_action.triggered.connect(self.show_search)
         view_menu = menu_bar.addMenu("View")
         toggle_dock_action = view_menu.addAction("Toggle File List")
         toggle_dock_action.triggered.connect(self.toggle_dock_visibility)
+        self.grid_view_action = view_menu.addAction("Camera Grid")
+        self.grid_view_action.setCheckable(True)
+        self.grid_view_action.toggled.connect(self.toggle_grid_view)
+        self.full_resolution_action = view_menu.addAction("Full Resolution Decode")
+        self.full_resolution_action.setCheckable(True)
+        self.full_resolution_action.toggled.connect(lambda checked: self.show_frame(self.current_frame))
+        self.trajectory_action = view_menu.addAction("Show Trajectories")
+        self.trajectory_action.setCheckable(True)
+        self.trajectory_action.toggled.connect(self.toggle_trajectories)
+        trail_length_action = view_menu.addAction("Set Trail Length")
+        trail_length_action.triggered.connect(self.set_trail_length)
+        self.profiler_action = view_menu.addAction("Profiler Overlay")
+        self.profiler_action.setCheckable(True)
+        self.profiler_action.toggled.connect(self.toggle_profiler_overlay)
+        export_profiler_action = view_menu.addAction("Export Profiler Stats")
+        export_profiler_action.triggered.connect(self.export_profiler_stats)
+        reset_profiler_action = view_menu.addAction("Reset Profiler Stats")
+        reset_profiler_action.triggered.connect(PROFILER.reset)
+        playback_rate_action = view_menu.addAction("Set Playback Rate")
+        playback_rate_action.triggered.connect(self.set_playback_rate)
+        thumbnail_interval_action = view_menu.addAction("Set Thumbnail Interval")
+        thumbnail_interval_action.triggered.connect(self.set_thumbnail_interval)
+        cache_size_action = view_menu.addAction("Set Frame Cache Size")
+        cache_size_action.triggered.connect(self.set_frame_cache_size)
+
+        self.playback_label = QLabel()
+        self.statusBar().addPermanentWidget(self.playback_label)
+        self.cache_label = QLabel()
+        self.statusBar().addPermanentWidget(self.cache_label)
+        self.update_cache_label()
 
         vertical_layout = QVBoxLayout()
         
@@ -121,8 +592,15 @@ class HDF5Viewer(QMainWindow):
         no_image_layout.addWidget(no_image_label)
         
         self.tab_widget.addTab(no_image_tab, "NO IMAGE")
+        self.tab_widget.currentChanged.connect(self.tab_changed)
         
         main_horizontal_layout.addWidget(self.tab_widget)
+
+        self.grid_widget = QWidget()
+        self.grid_layout = QGridLayout(self.grid_widget)
+        self.grid_layout.setContentsMargins(0, 0, 0, 0)
+        self.grid_widget.hide()
+        main_horizontal_layout.addWidget(self.grid_widget)
         
         ## 3D View
         self.gl_widget = gl.GLViewWidget()
@@ -146,8 +624,13 @@ class HDF5Viewer(QMainWindow):
         self.fb_button.setMaximumHeight(30)
         media_controls_layout.addWidget(self.fb_button)
         
+        self.reverse_button = QPushButton("Reverse")
+        self.reverse_button.clicked.connect(lambda: self.toggle_play(-1))
+        self.reverse_button.setMaximumHeight(30)
+        media_controls_layout.addWidget(self.reverse_button)
+
         self.play_button = QPushButton("Play")
-        self.play_button.clicked.connect(self.toggle_play)
+        self.play_button.clicked.connect(lambda: self.toggle_play(1))
         self.play_button.setMaximumHeight(30)
         media_controls_layout.addWidget(self.play_button)
         
@@ -155,6 +638,34 @@ class HDF5Viewer(QMainWindow):
         self.ff_button.clicked.connect(self.toggle_one_frame_forward)
         self.ff_button.setMaximumHeight(30)
         media_controls_layout.addWidget(self.ff_button)
+
+        self.speed_combo = QComboBox()
+        for speed in PLAYBACK_SPEEDS:
+            self.speed_combo.addItem(f"{speed:g}x", speed)
+        self.speed_combo.setCurrentIndex(PLAYBACK_SPEEDS.index(1.0))
+        self.speed_combo.currentIndexChanged.connect(self.speed_changed)
+        self.speed_combo.setMaximumHeight(30)
+        media_controls_layout.addWidget(self.speed_combo)
+
+        self.mark_in_button = QPushButton("In [")
+        self.mark_in_button.clicked.connect(lambda: self.set_mark_in())
+        self.mark_in_button.setMaximumHeight(30)
+        media_controls_layout.addWidget(self.mark_in_button)
+
+        self.mark_out_button = QPushButton("] Out")
+        self.mark_out_button.clicked.connect(lambda: self.set_mark_out())
+        self.mark_out_button.setMaximumHeight(30)
+        media_controls_layout.addWidget(self.mark_out_button)
+
+        self.split_button = QPushButton("Split |")
+        self.split_button.clicked.connect(self.add_split_point)
+        self.split_button.setMaximumHeight(30)
+        media_controls_layout.addWidget(self.split_button)
+
+        self.clear_marks_button = QPushButton("Clear Marks")
+        self.clear_marks_button.clicked.connect(self.clear_marks)
+        self.clear_marks_button.setMaximumHeight(30)
+        media_controls_layout.addWidget(self.clear_marks_button)
         vertical_layout.addLayout(media_controls_layout)
         
         ## Tick Label
@@ -164,16 +675,36 @@ class HDF5Viewer(QMainWindow):
         self.tick_label.setMaximumHeight(30)
         vertical_layout.addWidget(self.tick_label)
         
+        ## Signal Selection
+        signal_layout = QHBoxLayout()
+        signal_label = QLabel("Signal:")
+        signal_label.setMaximumHeight(30)
+        signal_layout.addWidget(signal_label)
+        self.signal_combo = QComboBox()
+        self.signal_combo.currentIndexChanged.connect(self.plot_signal)
+        signal_layout.addWidget(self.signal_combo, 1)
+        vertical_layout.addLayout(signal_layout)
+
         ## Plot Widget
         self.plot_widget = pg.PlotWidget()
         self.plot_widget.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
         self.plot_widget.getPlotItem().showGrid(x=True, y=True)
-        self.plot_widget.setMouseEnabled(x=False, y=False)
-        self.plot_widget.setMaximumHeight(50)
+        self.plot_widget.setMouseEnabled(x=True, y=False)
+        self.plot_widget.setMaximumHeight(120)
+        self.plot_widget.sigXRangeChanged.connect(self.redraw_signal)
+        self.plot_widget.getPlotItem().getViewBox().sigResized.connect(self.update_filmstrip_view)
         vertical_layout.addWidget(self.plot_widget)
 
+        ## Film Strip
+        self.filmstrip = FilmStrip()
+        self.filmstrip.frame_clicked.connect(self.filmstrip_clicked)
+        vertical_layout.addWidget(self.filmstrip)
+
         self.frame_line = pg.InfiniteLine(angle=90, movable=False, pen=pg.mkPen('r', width=2))
         self.plot_widget.addItem(self.frame_line)
+
+        self.range_region = pg.LinearRegionItem(values=(0, 0), movable=False, brush=pg.mkBrush(0, 255, 0, 40))
+        self.split_lines = []
         
         ## Tick Control Layout
         self.tick_control_layout = QVBoxLayout()
@@ -187,33 +718,77 @@ class HDF5Viewer(QMainWindow):
         
         self.layout.addLayout(vertical_layout)
 
+        ## Profiler Overlay
+        self.profiler_overlay = QLabel(self.central_widget)
+        self.profiler_overlay.setStyleSheet("font-family: monospace; font-size: 11px; color: white; background-color: rgba(0, 0, 0, 160); padding: 4px;")
+        self.profiler_overlay.hide()
+        self.profiler_timer = QTimer()
+        self.profiler_timer.timeout.connect(self.update_profiler_overlay)
+
     def load_hdf5(self):
         file_names, _ = QFileDialog.getOpenFileNames(self, "Open HDF5 Files", "", "HDF5 Files (*.hdf5)")
         
         if not file_names:
             return
 
-        progress_dialog = QProgressDialog("Loading HDF5 Files...", "Cancel", 0, len(file_names), self)
-        progress_dialog.setWindowTitle("Loading")
+        self.register_files(file_names)
+
+    def load_hdf5_directory(self):
+        directory = QFileDialog.getExistingDirectory(self, "Open HDF5 Directory")
+
+        if not directory:
+            return
+
+        file_names = robros_core.list_episodes(directory)
+        self.register_files(file_names)
+
+    def progress_callback(self, title, label, count):
+        ## Modal progress dialog plus the `progress(done, total)` callback the robros_core helpers take; returns False once canceled
+        progress_dialog = QProgressDialog(label, "Cancel", 0, count, self)
+        progress_dialog.setWindowTitle(title)
         progress_dialog.setWindowModality(Qt.WindowModality.ApplicationModal)
-        progress_dialog.setMinimumDuration(0)
+        progress_dialog.setMinimumDuration(500)
         progress_dialog.setValue(0)
-        progress_dialog.show()
-
-        for i, file_name in enumerate(file_names):
-            if file_name not in self.hdf5_files:
-                QApplication.processEvents()  
-                self.load_file(file_name)
-                self.hdf5_files.append(file_name)
-                
-                self.add_file_to_table(file_name)
-                
-                progress_dialog.setValue(i + 1)
-                
-                if progress_dialog.wasCanceled():
-                    break
 
+        def update_progress(done, total):
+            progress_dialog.setMaximum(total)
+            progress_dialog.setValue(done)
+            QApplication.processEvents()
+            return not progress_dialog.wasCanceled()
+
+        return progress_dialog, update_progress
+
+    def register_files(self, file_names):
+        ## Only read metadata here, the episode is fully loaded when its row is activated
+        new_files = [file_name for file_name in dict.fromkeys(os.path.abspath(file_name) for file_name in file_names) if file_name not in self.hdf5_files]
+        if not new_files:
+            return
+
+        progress_dialog, update_progress = self.progress_callback("Loading", "Scanning HDF5 Files...", len(new_files))
+        infos = robros_core.scan_files(new_files, progress=update_progress)
         progress_dialog.close()
+
+        failed = [file_name for file_name, info in infos.items() if 'error' in info]
+        added = [file_name for file_name in new_files if file_name in infos and 'error' not in infos[file_name]]
+
+        ## Rows move while they are filled if the table is sorted, so sorting is paused until every row is complete
+        self.file_table_widget.setUpdatesEnabled(False)
+        self.file_table_widget.setSortingEnabled(False)
+        for file_name in added:
+            self.hdf5_files.append(file_name)
+            self.episode_info[file_name] = infos[file_name]
+            self.add_file_to_table(file_name)
+            self.request_contact_thumbnail(file_name)
+        self.file_table_widget.setSortingEnabled(True)
+        self.file_table_widget.setUpdatesEnabled(True)
+
+        if failed:
+            QMessageBox.warning(self, "Warning", "Failed to read:\n" + "\n".join(os.path.basename(file_name) for file_name in failed))
+
+        if not hasattr(self, 'hdf5_file') and added:
+            row = self.find_file_row(added[0])
+            self.file_table_widget.selectRow(row)
+            self.load_selected_hdf5(row, 0)
     
     def save_hdf5(self):
         if not hasattr(self, 'hdf5_file'):
@@ -255,6 +830,28 @@ class HDF5Viewer(QMainWindow):
         save_to_same_file_checkbox.setChecked(True)
         dialog.layout().addWidget(save_to_same_file_checkbox)
 
+        recompress_checkbox = QCheckBox("Recompress images and datasets", dialog)
+        dialog.layout().addWidget(recompress_checkbox)
+        recompress_widget = QWidget(dialog)
+        recompress_layout = QGridLayout(recompress_widget)
+        codec_combo = QComboBox()
+        codec_combo.addItems(['keep'] + list(robros_core.IMAGE_CODECS))
+        codec_combo.setCurrentText('jpeg')
+        quality_spin = QSpinBox()
+        quality_spin.setRange(1, 100)
+        quality_spin.setValue(90)
+        max_size_edit = QLineEdit()
+        max_size_edit.setPlaceholderText("WIDTHxHEIGHT, empty keeps the size")
+        compression_combo = QComboBox()
+        compression_combo.addItems(['none'] + [name for name in robros_core.COMPRESSIONS if name != 'blosc' or robros_core.hdf5plugin is not None])
+        compression_combo.setCurrentText('gzip')
+        for row, (label, widget) in enumerate((("Image codec:", codec_combo), ("Quality:", quality_spin), ("Max size:", max_size_edit), ("Dataset compression:", compression_combo))):
+            recompress_layout.addWidget(QLabel(label), row, 0)
+            recompress_layout.addWidget(widget, row, 1)
+        recompress_widget.setEnabled(False)
+        recompress_checkbox.toggled.connect(recompress_widget.setEnabled)
+        dialog.layout().addWidget(recompress_widget)
+
         button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel, dialog)
         dialog.layout().addWidget(button_box)
 
@@ -278,22 +875,424 @@ class HDF5Viewer(QMainWindow):
                 QMessageBox.warning(self, "Warning", "No datasets selected to save.")
                 return
 
+            spec = {'datasets': selected_datasets}
+            if recompress_checkbox.isChecked():
+                try:
+                    max_size = robros_core.parse_size(max_size_edit.text()) if max_size_edit.text().strip() else None
+                except ValueError as e:
+                    QMessageBox.warning(self, "Warning", str(e))
+                    return
+                codec = None if codec_combo.currentText() == 'keep' else codec_combo.currentText()
+                spec['recompress'] = {
+                    'codec': codec or ('jpeg' if max_size else None),
+                    'quality': quality_spin.value(),
+                    'max_size': max_size,
+                    'compression': None if compression_combo.currentText() == 'none' else compression_combo.currentText(),
+                }
+
             if save_to_same_file:
-                file_name = self.file_name.text()
+                file_name = self.hdf5_file.filename
             else:
                 file_name, _ = QFileDialog.getSaveFileName(self, "Save HDF5 File", "", "HDF5 Files (*.hdf5)")
                 if not file_name:
                     return
 
-            with h5py.File(file_name, 'w') as hdf5_file:
-                for dataset_path in selected_datasets:
-                    if dataset_path in self.hdf5_file:
-                        data = self.hdf5_file[dataset_path][:]
-                        hdf5_file.create_dataset(dataset_path, data=data)
-                    else:
-                        QMessageBox.warning(self, "Warning", f"Dataset '{dataset_path}' does not exist in the file.")
+            result = self.write_episode(file_name, spec)
+            if result is None:
+                return
+            for dataset_path in result['missing']:
+                QMessageBox.warning(self, "Warning", f"Dataset '{dataset_path}' does not exist in the file.")
+
+            message = f"Data saved to {file_name}."
+            if 'recompress' in spec:
+                message += f"\n{result['source_size'] / 1e6:.1f} MB -> {result['output_size'] / 1e6:.1f} MB"
+                if result.get('encode_seconds'):
+                    message += f", {result['frames_encoded']} frames encoded at {result['frames_encoded'] / result['encode_seconds']:.0f} frames/s"
+                if result.get('frames_failed'):
+                    message += f"\n{result['frames_failed']} undecodable frames were kept as they were."
+            QMessageBox.information(self, "Success", message)
+
+    def write_episode(self, file_name, spec):
+        source_name = self.hdf5_file.filename
+        same_file = os.path.abspath(file_name) == os.path.abspath(source_name)
+        if same_file:
+            ## The replaced file is reopened below, the old handle must not outlive it
+            self.close_file()
+
+        try:
+            result = robros_core.edit_episode(source_name, file_name, spec)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to save {file_name}:\n{e}")
+            result = None
+
+        if same_file:
+            self.frame_cache.clear()
+            self.thumbnails.forget(source_name)
+            self.load_file(source_name)
+            self.refresh_file_info(source_name)
+
+        return result
+
+    def get_mark_range(self):
+        start = self.mark_in if self.mark_in is not None else 0
+        stop = self.mark_out + 1 if self.mark_out is not None else self.slider.maximum() + 1
+        return start, max(start, stop)
+
+    def set_mark_in(self, frame_index=None):
+        if not self.images_dict:
+            return
+        self.mark_in = self.current_frame if frame_index is None else frame_index
+        if self.mark_out is not None and self.mark_out < self.mark_in:
+            self.mark_out = None
+        self.update_markers()
+
+    def set_mark_out(self, frame_index=None):
+        if not self.images_dict:
+            return
+        self.mark_out = self.current_frame if frame_index is None else frame_index
+        if self.mark_in is not None and self.mark_in > self.mark_out:
+            self.mark_in = None
+        self.update_markers()
+
+    def add_split_point(self):
+        if not self.images_dict:
+            return
+        if self.current_frame in self.split_points:
+            self.split_points.remove(self.current_frame)
+        else:
+            self.split_points.append(self.current_frame)
+        self.update_markers()
+
+    def clear_marks(self):
+        self.mark_in = None
+        self.mark_out = None
+        self.split_points = []
+        self.update_markers()
+
+    def update_markers(self):
+        for item in [self.range_region] + self.split_lines:
+            self.plot_widget.removeItem(item)
+        self.split_lines = []
+
+        if self.mark_in is not None or self.mark_out is not None:
+            start, stop = self.get_mark_range()
+            self.range_region.setRegion((start, stop - 1))
+            self.plot_widget.addItem(self.range_region)
+
+        for split_point in sorted(self.split_points):
+            split_line = pg.InfiniteLine(pos=split_point, angle=90, movable=False, pen=pg.mkPen('g', width=1, style=Qt.PenStyle.DashLine))
+            self.plot_widget.addItem(split_line)
+            self.split_lines.append(split_line)
+
+    def export_trimmed(self):
+        if not hasattr(self, 'hdf5_file'):
+            QMessageBox.warning(self, "Warning", "No HDF5 file loaded.")
+            return
+
+        file_name, _ = QFileDialog.getSaveFileName(self, "Export Trimmed Episode", "", "HDF5 Files (*.hdf5)")
+        if not file_name:
+            return
+
+        start, stop = self.get_mark_range()
+        if self.write_episode(file_name, {'frames': [start, stop]}) is not None:
+            QMessageBox.information(self, "Success", f"Frames {start} - {stop - 1} saved to {file_name}.")
+
+    def export_split(self):
+        if not hasattr(self, 'hdf5_file'):
+            QMessageBox.warning(self, "Warning", "No HDF5 file loaded.")
+            return
+
+        file_name, _ = QFileDialog.getSaveFileName(self, "Export Split Episodes", "", "HDF5 Files (*.hdf5)")
+        if not file_name:
+            return
+
+        root, ext = os.path.splitext(file_name)
+        start, stop = self.get_mark_range()
+        frame_ranges = robros_core.split_ranges(start, stop, self.split_points)
+
+        progress_dialog = QProgressDialog("Exporting Episodes...", "Cancel", 0, len(frame_ranges), self)
+        progress_dialog.setWindowTitle("Exporting")
+        progress_dialog.setWindowModality(Qt.WindowModality.ApplicationModal)
+        progress_dialog.setMinimumDuration(0)
+
+        output_names = []
+        for i, frame_range in enumerate(frame_ranges):
+            output_name = f"{root}_{i:03d}{ext or '.hdf5'}"
+            if os.path.abspath(output_name) == os.path.abspath(self.hdf5_file.filename):
+                QMessageBox.warning(self, "Warning", f"Refusing to overwrite the open episode with {output_name}.")
+                break
+            if self.write_episode(output_name, {'frames': frame_range}) is None:
+                break
+            output_names.append(output_name)
+            progress_dialog.setValue(i + 1)
+            QApplication.processEvents()
+            if progress_dialog.wasCanceled():
+                break
+
+        progress_dialog.close()
+        if output_names:
+            QMessageBox.information(self, "Success", f"{len(output_names)} episodes saved:\n" + "\n".join(os.path.basename(name) for name in output_names))
+
+    def show_dataset_stats(self):
+        if not self.hdf5_files:
+            QMessageBox.warning(self, "Warning", "No HDF5 files loaded.")
+            return
+
+        progress_dialog, update_progress = self.progress_callback("Statistics", "Computing Statistics...", len(self.hdf5_files))
+        report = robros_stats.compute_stats(self.hdf5_files, progress=update_progress)
+        canceled = progress_dialog.wasCanceled()
+        progress_dialog.close()
+        if canceled:
+            return
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Dataset Statistics")
+        dialog.setGeometry(100, 100, 900, 700)
+        dialog.setLayout(QVBoxLayout())
+
+        length = report['length'] or {}
+        summary = f"{report['episodes']} episodes, {length.get('total', 0)} frames"
+        if length:
+            summary += f", length {length['min']} - {length['max']} (mean {length['mean']:.1f})"
+        if report['failed']:
+            summary += f", {len(report['failed'])} failed: " + ", ".join(report['failed'])
+        summary_label = QLabel(summary)
+        summary_label.setWordWrap(True)
+        dialog.layout().addWidget(summary_label)
+
+        if length:
+            histogram_plot = pg.PlotWidget()
+            histogram_plot.setMaximumHeight(160)
+            histogram_plot.setTitle("Episode Length")
+            edges = np.array(length['histogram']['edges'])
+            histogram_plot.addItem(pg.BarGraphItem(x0=edges[:-1], x1=edges[1:], height=length['histogram']['counts'], brush='c'))
+            dialog.layout().addWidget(histogram_plot)
+
+        quantile_keys = ['p1', 'p50', 'p99']
+        tree_widget = QTreeWidget(dialog)
+        tree_widget.setHeaderLabels(["Dataset", "Mean", "Std", "Min", "Max"] + [key.upper() for key in quantile_keys])
+        tree_widget.header().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        dialog.layout().addWidget(tree_widget)
+
+        def format_value(value):
+            return "-" if value is None else f"{value:.4g}"
+
+        def add_stats(name, stats):
+            item = QTreeWidgetItem(tree_widget)
+            item.setText(0, name)
+            columns = len(stats['mean'])
+            rows = [item] if columns == 1 else []
+            for column in range(columns if columns > 1 else 0):
+                child = QTreeWidgetItem(item)
+                child.setText(0, f"[{column}]")
+                rows.append(child)
+            for column, row in enumerate(rows):
+                values = [stats[key][column] for key in ('mean', 'std', 'min', 'max')] + [stats['quantiles'][key][column] for key in quantile_keys]
+                for i, value in enumerate(values):
+                    row.setText(i + 1, format_value(value))
+
+        for name, stats in report['datasets'].items():
+            add_stats(name, stats)
+        for name, stats in report['brightness'].items():
+            add_stats(f"observations/images/{name} brightness", stats)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Save | QDialogButtonBox.StandardButton.Close, dialog)
+        dialog.layout().addWidget(button_box)
+        button_box.rejected.connect(dialog.reject)
+
+        def export_stats():
+            file_name, _ = QFileDialog.getSaveFileName(dialog, "Export Statistics", "", "JSON Files (*.json)")
+            if not file_name:
+                return
+            try:
+                with open(file_name, 'w') as stats_file:
+                    json.dump(report, stats_file, indent=1)
+            except OSError as e:
+                QMessageBox.critical(dialog, "Error", f"Failed to write {file_name}:\n{e}")
+
+        button_box.accepted.connect(export_stats)
+        dialog.exec()
+
+    def refresh_file_info(self, file_name):
+        if file_name not in self.episode_info:
+            return
+
+        info = robros_core.scan_files([file_name])[file_name]
+        if 'error' in info:
+            return
+
+        self.episode_info[file_name] = info
+        row = self.find_file_row(file_name)
+        if row is not None:
+            ## The count write would re-sort the table and move the row before its QC cell is reset
+            self.file_table_widget.setSortingEnabled(False)
+            self.file_table_widget.item(row, 1).setData(Qt.ItemDataRole.DisplayRole, info['data_count'])
+            self.set_qc_result(row, None)
+            self.file_table_widget.setSortingEnabled(True)
+        self.request_contact_thumbnail(file_name)
+
+    def find_file_row(self, file_name):
+        return self.file_rows().get(file_name)
+
+    def file_rows(self):
+        ## {path: row}; only valid until the table is sorted again
+        return {self.file_table_widget.item(row, 0).data(Qt.ItemDataRole.UserRole): row for row in range(self.file_table_widget.rowCount())}
+
+    def quality_check_files(self):
+        if not self.hdf5_files:
+            QMessageBox.warning(self, "Warning", "No HDF5 files loaded.")
+            return
+
+        modes = ["JPEG headers (fast)", "Full JPEG decode"]
+        mode, ok = QInputDialog.getItem(self, "Quality Check", "Check images by:", modes, 0, False)
+        if not ok:
+            return
+
+        progress_dialog, update_progress = self.progress_callback("Quality Check", "Checking HDF5 Files...", len(self.hdf5_files))
+        results = robros_qc.check_files(self.hdf5_files, full_decode=mode == modes[1], progress=update_progress)
+        progress_dialog.close()
+
+        self.file_table_widget.setSortingEnabled(False)
+        rows = self.file_rows()
+        for file_name, entry in results.items():
+            if file_name in rows:
+                self.set_qc_result(rows[file_name], entry)
+        self.file_table_widget.setSortingEnabled(True)
 
-            QMessageBox.information(self, "Success", f"Data saved to {file_name}.")
+        counts = [entry['status'] for entry in results.values()]
+        self.statusBar().showMessage(f"Quality check: {counts.count('ok')} ok, {counts.count('warning')} warnings, {counts.count('error')} errors", 10000)
+
+    def show_search(self):
+        if not self.hdf5_files:
+            QMessageBox.warning(self, "Warning", "No HDF5 files loaded.")
+            return
+
+        progress_dialog, update_progress = self.progress_callback("Search", "Indexing HDF5 Files...", len(self.hdf5_files))
+        ## Unchanged episodes come straight from the sidecar cache, so reopening the dialog refreshes the index cheaply
+        entries = robros_search.index_files(self.hdf5_files, progress=update_progress)
+        canceled = progress_dialog.wasCanceled()
+        progress_dialog.close()
+        if canceled:
+            return
+        self.search_index = robros_search.SearchIndex(entries)
+
+        if self.search_dialog is None:
+            self.build_search_dialog()
+        current_camera = self.search_camera_combo.currentText() or self.tab_widget.tabText(self.tab_widget.currentIndex())
+        self.search_camera_combo.clear()
+        self.search_camera_combo.addItems(sorted(self.search_index.hashes))
+        self.search_camera_combo.setCurrentText(current_camera)
+        self.search_dialog.show()
+        self.search_dialog.raise_()
+        self.run_search()
+
+    def build_search_dialog(self):
+        ## Non-modal, so hits can be clicked through while the episode plays in the main window
+        self.search_dialog = QDialog(self)
+        self.search_dialog.setWindowTitle("Search Similar")
+        self.search_dialog.setGeometry(100, 100, 600, 500)
+        self.search_dialog.setLayout(QVBoxLayout())
+
+        options_layout = QGridLayout()
+        self.search_mode_combo = QComboBox()
+        for text, mode in SEARCH_MODES:
+            self.search_mode_combo.addItem(text, mode)
+        self.search_camera_combo = QComboBox()
+        self.search_per_episode_checkbox = QCheckBox("Best frame per episode")
+        self.search_per_episode_checkbox.setChecked(True)
+        self.search_include_current_checkbox = QCheckBox("Include the current episode")
+        search_button = QPushButton("Search")
+        options_layout.addWidget(QLabel("Find:"), 0, 0)
+        options_layout.addWidget(self.search_mode_combo, 0, 1)
+        options_layout.addWidget(QLabel("Camera:"), 1, 0)
+        options_layout.addWidget(self.search_camera_combo, 1, 1)
+        options_layout.addWidget(self.search_per_episode_checkbox, 2, 0)
+        options_layout.addWidget(self.search_include_current_checkbox, 2, 1)
+        options_layout.addWidget(search_button, 3, 1)
+        self.search_dialog.layout().addLayout(options_layout)
+
+        self.search_status_label = QLabel()
+        self.search_dialog.layout().addWidget(self.search_status_label)
+
+        self.search_table = QTableWidget(0, 3)
+        self.search_table.setHorizontalHeaderLabels(["File Name", "Frame", "Distance"])
+        self.search_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.search_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.search_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.search_table.cellClicked.connect(self.search_hit_clicked)
+        self.search_dialog.layout().addWidget(self.search_table)
+
+        def update_options():
+            mode = self.search_mode_combo.currentData()
+            self.search_camera_combo.setEnabled(mode == 'image')
+            self.search_per_episode_checkbox.setEnabled(mode in ('pose', 'image'))
+
+        self.search_mode_combo.currentIndexChanged.connect(update_options)
+        self.search_mode_combo.currentIndexChanged.connect(self.run_search)
+        search_button.clicked.connect(self.run_search)
+        update_options()
+
+    def run_search(self):
+        ## Queries start from the episode and frame currently shown
+        if self.search_index is None or not hasattr(self, 'hdf5_file'):
+            self.search_status_label.setText("Load an episode to search from.")
+            return
+
+        file_name = self.hdf5_file.filename
+        mode = self.search_mode_combo.currentData()
+        exclude = None if self.search_include_current_checkbox.isChecked() else file_name
+        per_episode = self.search_per_episode_checkbox.isChecked()
+        hits = []
+        start = time.perf_counter()
+        if mode == 'pose':
+            if self.xpos_data is not None and self.current_frame < len(self.xpos_data):
+                hits = self.search_index.nearest_poses(self.xpos_data[self.current_frame], exclude=exclude, per_episode=per_episode)
+        elif mode == 'image':
+            camera = self.search_camera_combo.currentText()
+            if camera in self.images_dict:
+                query_hash = self.search_index.frame_hash(file_name, camera, self.current_frame)
+                hits = self.search_index.similar_frames(camera, query_hash, exclude=exclude, per_episode=per_episode)
+        else:
+            hits = self.search_index.similar_episodes(file_name, mode)
+        elapsed = time.perf_counter() - start
+
+        self.search_table.setRowCount(0)
+        for hit in hits:
+            row = self.search_table.rowCount()
+            self.search_table.insertRow(row)
+            file_item = QTableWidgetItem(os.path.basename(hit['file']))
+            file_item.setData(Qt.ItemDataRole.UserRole, hit['file'])
+            self.search_table.setItem(row, 0, file_item)
+            self.search_table.setItem(row, 1, QTableWidgetItem(str(hit['frame'])))
+            self.search_table.setItem(row, 2, QTableWidgetItem(f"{hit['distance']:.4g}"))
+
+        summary = f"{len(hits)} hits from {len(self.search_index)} episodes in {elapsed * 1000:.1f} ms, from {os.path.basename(file_name)}"
+        if mode in ('pose', 'image'):
+            summary += f" frame {self.current_frame}"
+        if self.search_index.failed:
+            summary += f"\n{len(self.search_index.failed)} episodes could not be indexed: " + ", ".join(self.search_index.failed)
+        self.search_status_label.setText(summary)
+
+    def search_hit_clicked(self, row, column):
+        self.jump_to_frame(self.search_table.item(row, 0).data(Qt.ItemDataRole.UserRole), int(self.search_table.item(row, 1).text()))
+
+    def jump_to_frame(self, file_name, frame_index):
+        if not hasattr(self, 'hdf5_file') or self.hdf5_file.filename != file_name:
+            self.load_file(file_name)
+        row = self.find_file_row(file_name)
+        if row is not None:
+            self.file_table_widget.selectRow(row)
+        self.filmstrip_clicked(frame_index)
+
+    def set_qc_result(self, row, entry):
+        ## None marks the episode as not checked, e.g. after it was rewritten
+        qc_item = RankedItem("-" if entry is None else robros_qc.summarize(entry))
+        qc_item.setFlags(qc_item.flags() & ~Qt.ItemFlag.ItemIsEditable)
+        qc_item.setData(Qt.ItemDataRole.UserRole, -1 if entry is None else robros_qc.SEVERITY[entry['status']])
+        if entry is not None and entry['issues']:
+            qc_item.setToolTip("\n".join(f"{issue['dataset'] or ''}: {issue['message']}" for issue in entry['issues']))
+            qc_item.setBackground(QColor(200, 60, 60, 120) if entry['status'] == 'error' else QColor(220, 180, 40, 120))
+        self.file_table_widget.setItem(row, 2, qc_item)
 
     def add_file_to_table(self, file_name):
         row_position = self.file_table_widget.rowCount()
@@ -301,20 +1300,36 @@ class HDF5Viewer(QMainWindow):
         
         file_item = QTableWidgetItem(os.path.basename(file_name))
         file_item.setFlags(file_item.flags() & ~Qt.ItemFlag.ItemIsEditable)
+        file_item.setData(Qt.ItemDataRole.UserRole, file_name)
         self.file_table_widget.setItem(row_position, 0, file_item)
         
-        data_count = self.get_data_count(file_name)
-        data_count_item = QTableWidgetItem(str(data_count))
+        data_count = self.episode_info[file_name]['data_count']
+        data_count_item = QTableWidgetItem()
+        data_count_item.setData(Qt.ItemDataRole.DisplayRole, data_count)
         data_count_item.setFlags(data_count_item.flags() & ~Qt.ItemFlag.ItemIsEditable)
         self.file_table_widget.setItem(row_position, 1, data_count_item)
+        self.set_qc_result(row_position, None)
 
-    def get_data_count(self, file_name):
-        with h5py.File(file_name, 'r') as hdf5_file:
-            total_data_length = sum(len(hdf5_file['observations/images'][key]) for key in hdf5_file['observations/images'])
-            num_images = len(hdf5_file['observations/images'])
-            return total_data_length // num_images
+    def close_file(self):
+        if not hasattr(self, 'hdf5_file'):
+            return
+
+        self.stop_playback()
+        self.prefetcher.set_streams({})
+        self.release_filmstrip()
+        self.images_dict = {}
+        self.grid_labels = {}
+        for lazy_array in (self.xpos_data, getattr(self, 'reward_data', None), self.signal_data):
+            if lazy_array is not None:
+                lazy_array.close()
+        self.xpos_data = None
+        self.reward_data = None
+        self.signal_data = None
+        self.hdf5_file.close()
+        del self.hdf5_file
 
     def load_file(self, file_name):
+        self.close_file()
         self.tab_widget.clear()
 
         self.file_name.setText(os.path.basename(file_name))
@@ -324,26 +1339,33 @@ class HDF5Viewer(QMainWindow):
 
         self.should_plot_reward = 'rewards/task' in self.hdf5_file
         if self.should_plot_reward:
-            self.reward_data = self.hdf5_file['rewards/task'][:]
-        
-        self.total_data_length = sum(len(self.hdf5_file['observations/images'][key]) for key in self.hdf5_file['observations/images'])
+            self.reward_data = robros_core.LazyArray(self.hdf5_file['rewards/task'])
         
         self.num_images = len(self.hdf5_file['observations/images'])
+
+        self.total_frames = robros_core.episode_length(self.hdf5_file) or 0
+        camera_lengths = {key: len(dataset) for key, dataset in self.hdf5_file['observations/images'].items()}
+        if len(set(camera_lengths.values())) > 1:
+            self.statusBar().showMessage("Camera lengths differ: " + ", ".join(f"{key} {length}" for key, length in camera_lengths.items()), 10000)
         
-        self.total_frames = self.total_data_length // self.num_images
-        
+        self.image_shapes = {}
         for key in self.hdf5_file['observations/images']:
             self.images_dict[key] = self.hdf5_file[f'observations/images/{key}']
+            self.image_shapes[key] = robros_core.read_image_shape(self.images_dict[key])
             tab = QWidget()
             tab_layout = QVBoxLayout(tab)
             
-            image_label = QLabel("No Image Loaded")
-            image_label.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
-            image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            image_label = FrameView()
+            image_label.resized.connect(self.frame_view_resized)
             tab_layout.addWidget(image_label)
 
             self.tab_widget.addTab(tab, key)
-            self.tab_widget.currentChanged.connect(self.tab_changed)
+
+        self.build_grid()
+
+        self.mark_in = None
+        self.mark_out = None
+        self.split_points = []
 
         self.current_frame = 0
         self.show_frame(self.current_frame)
@@ -351,85 +1373,317 @@ class HDF5Viewer(QMainWindow):
         self.slider.setValue(0)
 
         if 'observations/xpos' in self.hdf5_file:
-            self.xpos_data = self.hdf5_file['observations/xpos'][:]
-            self.update_3d_visualization(self.current_frame)
+            self.xpos_data = robros_core.LazyArray(self.hdf5_file['observations/xpos'])
         else:
             self.xpos_data = None
-
-        self.plot_reward()
+        self.build_3d_scene()
+        self.update_3d_visualization(self.current_frame)
+
+        self.file_mtime = os.path.getmtime(file_name)
+        self.playback_clock.set_rate(rate=robros_core.episode_rate(self.hdf5_file) or DEFAULT_PLAYBACK_RATE)
+        self.update_playback_label()
+        self.populate_signals()
+        self.plot_signal()
+        self.request_filmstrip()
+
+    def build_grid(self):
+        while self.grid_layout.count():
+            self.grid_layout.takeAt(0).widget().deleteLater()
+        self.grid_labels = {}
+
+        columns = max(1, int(np.ceil(np.sqrt(len(self.images_dict)))))
+        for i, key in enumerate(self.images_dict):
+            cell = QWidget()
+            cell_layout = QVBoxLayout(cell)
+            cell_layout.setContentsMargins(0, 0, 0, 0)
+
+            title_label = QLabel(key)
+            title_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            title_label.setMaximumHeight(20)
+            cell_layout.addWidget(title_label)
+
+            image_label = FrameView()
+            image_label.resized.connect(self.frame_view_resized)
+            cell_layout.addWidget(image_label)
+
+            self.grid_layout.addWidget(cell, i // columns, i % columns)
+            self.grid_labels[key] = image_label
+
+    def toggle_grid_view(self, checked):
+        self.grid_mode = checked
+        self.tab_widget.setVisible(not checked)
+        self.grid_widget.setVisible(checked)
+        self.show_frame(self.current_frame)
 
     def load_selected_hdf5(self, row, column):
-        file_name = self.file_table_widget.item(row, 0).text()
-        full_path = next((f for f in self.hdf5_files if os.path.basename(f) == file_name), None)
-        if full_path:
+        full_path = self.file_table_widget.item(row, 0).data(Qt.ItemDataRole.UserRole)
+        if full_path and (not hasattr(self, 'hdf5_file') or self.hdf5_file.filename != full_path):
             self.load_file(full_path)
 
-    def show_frame(self, frame_index):
+    def visible_views(self):
+        ## {camera: FrameView} for what is on screen: the whole grid, or the current tab
         current_tab = self.tab_widget.currentWidget()
-        
-        if current_tab is None:
+        current_tab_name = self.tab_widget.tabText(self.tab_widget.currentIndex())
+        if current_tab is None or current_tab_name not in self.images_dict:
+            return {}
+        if self.grid_mode and current_tab_name in self.grid_labels:
+            return dict(self.grid_labels)
+        return {current_tab_name: current_tab.layout().itemAt(0).widget()}
+
+    def view_reduction(self, name, image_label):
+        ## Decode at the smallest JPEG scale that still fills the view, unless full resolution is forced
+        if self.full_resolution_action.isChecked():
+            return 1
+        pixel_ratio = image_label.devicePixelRatioF()
+        return robros_core.decode_reduction(self.image_shapes.get(name), image_label.width() * pixel_ratio, image_label.height() * pixel_ratio)
+
+    def frame_view_resized(self):
+        ## Views resize many times during a drag or a grid toggle, so the check runs once things settle
+        if self.resize_check_scheduled:
+            return
+        self.resize_check_scheduled = True
+        QTimer.singleShot(50, self.check_view_reductions)
+
+    def check_view_reductions(self):
+        ## A view that grew past its decode scale would upsample a reduced decode until the next frame is shown
+        self.resize_check_scheduled = False
+        views = self.visible_views()
+        if any(name not in self.prefetcher.streams or self.view_reduction(name, view) < self.prefetcher.streams[name][2] for name, view in views.items()):
+            self.show_frame(self.current_frame)
+
+    def show_frame(self, frame_index):
+        image_labels = self.visible_views()
+        if not image_labels:
             return
+        current_tab_name = self.tab_widget.tabText(self.tab_widget.currentIndex())
+        current_dataset = self.images_dict[current_tab_name]
 
-        image_label = current_tab.layout().itemAt(0).widget()
-        current_dataset = self.images_dict[self.tab_widget.tabText(self.tab_widget.currentIndex())]
+        streams = {}
+        for name, image_label in image_labels.items():
+            reduction = self.view_reduction(name, image_label)
+            streams[name] = (self.images_dict[name], (self.hdf5_file.filename, name, reduction), reduction)
+        if self.prefetcher.streams != streams:
+            self.prefetcher.set_streams(streams)
 
         if current_dataset is not None and 0 <= frame_index < current_dataset.shape[0]:
-            image_data = current_dataset[frame_index]
-            image_array = np.frombuffer(image_data, dtype=np.uint8)
-            image_cv = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-            image = QImage(image_cv, image_cv.shape[1], image_cv.shape[0], QImage.Format.Format_RGB888)
-            pixmap = QPixmap.fromImage(image)
-            scaled_pixmap = pixmap.scaled(image_label.size(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-            image_label.setPixmap(scaled_pixmap)
-            self.slider.setValue(frame_index)
-            self.tick_label.setText(f"{frame_index} / {current_dataset.shape[0] - 1}")
+            with PROFILER.stage('frame'):
+                self.render_frame(frame_index, current_tab_name, image_labels, streams)
+
+    def render_frame(self, frame_index, current_tab_name, image_labels, streams):
+        current_dataset = self.images_dict[current_tab_name]
+        names = [name for name in image_labels if frame_index < self.images_dict[name].shape[0]]
+        images = {}
+        for name in names:
+            image = self.prefetcher.take(name, frame_index)
+            if image is None:
+                image = self.frame_cache.get(streams[name][1] + (frame_index,))
+            if image is not None:
+                images[name] = image
+
+        missing = [name for name in names if name not in images]
+        if missing:
+            with PROFILER.stage('fetch'):
+                images.update(self.prefetcher.fetch(frame_index, missing))
+
+        ## All cameras are decoded before any is drawn, so the grid always shows one tick
+        for name in names:
+            if images[name] is not None:
+                self.frame_cache.put(streams[name][1] + (frame_index,), images[name])
+                image_labels[name].set_image(images[name])
+            else:
+                image_labels[name].set_text(f"Frame {frame_index} could not be decoded")
+
+        self.update_cache_label()
+        self.filmstrip.set_current_frame(frame_index)
+        self.prefetcher.request(frame_index, self.play_direction, self.prefetch_stride())
+        ## The frame is already being drawn, so the slider must not re-enter show_frame through slider_changed
+        self.slider.blockSignals(True)
+        self.slider.setValue(frame_index)
+        self.slider.blockSignals(False)
+        self.tick_label.setText(f"{frame_index} / {current_dataset.shape[0] - 1}")
+        with PROFILER.stage('plot'):
             self.frame_line.setPos(frame_index)
-            frame_width = scaled_pixmap.width()
-            frame_height = scaled_pixmap.height()
-            self.image_info_label.setText(f"W: {frame_width} / H: {frame_height}")
+        target_rect = image_labels[current_tab_name].target_rect().toRect()
+        if not target_rect.isEmpty():
+            self.image_info_label.setText(f"W: {target_rect.width()} / H: {target_rect.height()}")
+        else:
+            self.image_info_label.setText("W: 0 / H: 0")
 
+        with PROFILER.stage('3d'):
             self.update_3d_visualization(frame_index)
 
-    def update_3d_visualization(self, frame_index):
+    def build_3d_scene(self):
+        ## Items are created once per file, update_3d_visualization only feeds them new positions
+        self.gl_widget.clear()
+        self.scatter_item = None
+        self.trail_item = None
+
         if self.xpos_data is None:
             return
 
-        self.gl_widget.clear()
+        num_objects = self.xpos_data.shape[1] // 3
+        if num_objects == 0:
+            return
+
+        if self.trajectory_action.isChecked():
+            step = max(1, self.xpos_data.shape[0] // MAX_TRAJECTORY_POINTS)
+            trajectories = np.asarray(self.xpos_data[::step])
+            for i in range(num_objects):
+                trajectory = gl.GLLinePlotItem(pos=trajectories[:, i*3:(i+1)*3], color=(0.5, 0.5, 0.5, 0.5), width=1, mode='line_strip')
+                self.gl_widget.addItem(trajectory)
+
+        if self.trail_length > 0:
+            alphas = np.repeat(np.linspace(0.05, 0.6, self.trail_length, dtype=np.float32), num_objects)
+            self.trail_colors = np.ones((self.trail_length * num_objects, 4), dtype=np.float32)
+            self.trail_colors[:, 3] = alphas
+            self.trail_positions = np.zeros((self.trail_length * num_objects, 3), dtype=np.float32)
+            self.trail_item = gl.GLScatterPlotItem(pos=self.trail_positions, color=self.trail_colors, size=5)
+            self.gl_widget.addItem(self.trail_item)
+
+        ## pyqtgraph keeps float32 contiguous positions as they are, so these buffers are never copied on setData
+        self.scatter_positions = np.zeros((num_objects, 3), dtype=np.float32)
+        self.scatter_item = gl.GLScatterPlotItem(pos=self.scatter_positions, color=(1, 1, 1, 1), size=10)
+        self.gl_widget.addItem(self.scatter_item)
+
+    def update_3d_visualization(self, frame_index):
+        if self.xpos_data is None or self.scatter_item is None or frame_index >= self.xpos_data.shape[0]:
+            return
 
         num_objects = self.xpos_data.shape[1] // 3
-        
-        for i in range(num_objects):
-            xyz_data = self.xpos_data[frame_index, i*3:(i+1)*3].reshape(1, 3)
-            scatter = gl.GLScatterPlotItem(pos=xyz_data, color=(1, 1, 1, 1), size=10)
-            self.gl_widget.addItem(scatter)
+        np.copyto(self.scatter_positions, self.xpos_data[frame_index, :num_objects * 3].reshape(num_objects, 3))
+        self.scatter_item.setData(pos=self.scatter_positions)
+
+        if self.trail_item is not None:
+            ## Copy the last K frames into the preallocated buffer, padding with the first frame near the start
+            start = max(0, frame_index - self.trail_length + 1)
+            window = self.xpos_data[start:frame_index + 1, :num_objects * 3].reshape(-1, num_objects, 3)
+            trail = self.trail_positions.reshape(self.trail_length, num_objects, 3)
+            np.copyto(trail[:self.trail_length - len(window)], window[0])
+            np.copyto(trail[self.trail_length - len(window):], window)
+            self.trail_item.setData(pos=self.trail_positions)
+
+    def set_trail_length(self):
+        trail_length, ok = QInputDialog.getInt(self, "Trail Length", "Trail length (frames, 0 to disable):", self.trail_length, 0, 1000)
+        if ok:
+            self.trail_length = trail_length
+            self.build_3d_scene()
+            self.update_3d_visualization(self.current_frame)
 
+    def toggle_trajectories(self, checked):
+        self.build_3d_scene()
+        self.update_3d_visualization(self.current_frame)
 
     def next_frame(self):
         if not hasattr(self, 'images_dict') or not self.images_dict:
-            if self.timer.isActive():
-                self.timer.stop()
-                self.play_button.setText("Play")
+            self.stop_playback()
             return
 
         current_tab_name = self.tab_widget.tabText(self.tab_widget.currentIndex())
         
         if current_tab_name not in self.images_dict:
-            if self.timer.isActive():
-                self.timer.stop()
-                self.play_button.setText("Play")
+            self.stop_playback()
             QMessageBox.warning(self, "Warning", "Current tab does not contain image data.")
             return
 
-        self.current_frame = (self.current_frame + 1) % self.images_dict[current_tab_name].shape[0]
+        ## Jump to wherever the clock is now; anything in between counts as dropped
+        position = self.playback_clock.position()
+        step = position - self.playback_position
+        if step == 0:
+            return
+
+        num_frames = self.images_dict[current_tab_name].shape[0]
+        target = (self.current_frame + step) % num_frames
+        next_frame = target
+        if not self.prefetcher.is_ready(target):
+            ## Decoding is behind the clock: show the newest frame already decoded on the way and drop the rest,
+            ## only waiting when the target is the very next frame. Unseen frames are never decoded on the GUI thread.
+            shown = self.prefetcher.newest_ready(self.current_frame, step, num_frames) if abs(step) > 1 else None
+            if shown is None:
+                if self.prefetcher.is_pending(target):
+                    return
+            else:
+                position -= step - shown
+                step = shown
+                next_frame = (self.current_frame + step) % num_frames
+
+        self.playback_clock.presented(step)
+        self.playback_position = position
+        self.current_frame = next_frame
         self.show_frame(self.current_frame)
+        if next_frame != target:
+            ## Decode ahead of the clock rather than of the frame on screen, so the display catches up instead of trailing
+            self.prefetcher.request(target, self.play_direction, self.prefetch_stride())
+        self.update_playback_label()
 
-    def toggle_play(self):
+    def toggle_play(self, direction=1):
         if self.timer.isActive():
-            self.timer.stop()
-            self.play_button.setText("Play")
+            self.stop_playback()
         else:
-            self.timer.start(10) 
+            self.play_direction = direction
+            self.playback_position = 0
+            self.playback_clock.start(self.playback_position, direction)
+            self.timer.start(self.playback_interval())
             self.play_button.setText("Pause")
+            self.reverse_button.setText("Pause")
+
+    def stop_playback(self):
+        self.timer.stop()
+        self.play_button.setText("Play")
+        self.reverse_button.setText("Reverse")
+
+    def playback_interval(self):
+        ## Tick about twice per frame, never slower than the old 10 ms
+        return max(1, min(10, int(500 / (self.playback_clock.rate * self.playback_clock.speed))))
+
+    def prefetch_stride(self):
+        ## How far playback moves per presented frame; single-stepping and scrubbing decode every frame
+        if not self.timer.isActive():
+            return 1
+        return max(1, round(self.playback_clock.expected_step(self.timer.interval() / 1000)))
+
+    def speed_changed(self, index):
+        self.playback_clock.set_rate(speed=self.speed_combo.itemData(index))
+        if self.timer.isActive():
+            self.timer.setInterval(self.playback_interval())
+        self.update_playback_label()
+
+    def set_playback_rate(self):
+        rate, ok = QInputDialog.getDouble(self, "Playback Rate", "Recording rate (Hz):", self.playback_clock.rate, 0.1, 10000, 2)
+        if ok:
+            self.playback_clock.set_rate(rate=rate)
+            if self.timer.isActive():
+                self.timer.setInterval(self.playback_interval())
+            self.update_playback_label()
+
+    def toggle_profiler_overlay(self, checked):
+        self.profiler_overlay.setVisible(checked)
+        if checked:
+            self.update_profiler_overlay()
+            self.profiler_timer.start(500)
+        else:
+            self.profiler_timer.stop()
+
+    def update_profiler_overlay(self):
+        lines = [f"{'stage':<8}{'p50':>8}{'p95':>8}{'p99':>8}{'n':>7}"]
+        for name, values in sorted(PROFILER.stats().items()):
+            lines.append(f"{name:<8}{values['p50_ms']:>8.2f}{values['p95_ms']:>8.2f}{values['p99_ms']:>8.2f}{values['count']:>7}")
+        self.profiler_overlay.setText("\n".join(lines) + "\n(ms)")
+        self.profiler_overlay.adjustSize()
+        self.profiler_overlay.move(self.tab_widget.mapTo(self.central_widget, self.tab_widget.rect().topLeft()) + QPoint(10, 30))
+        self.profiler_overlay.raise_()
+
+    def export_profiler_stats(self):
+        file_name, _ = QFileDialog.getSaveFileName(self, "Export Profiler Stats", "", "JSON Files (*.json);;CSV Files (*.csv)")
+        if not file_name:
+            return
+        try:
+            PROFILER.dump(file_name)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Failed to write {file_name}:\n{e}")
+
+    def update_playback_label(self):
+        clock = self.playback_clock
+        self.playback_label.setText(f"{clock.rate * clock.speed:g} Hz target / {clock.fps():.1f} fps / {clock.dropped} dropped")
 
     def slider_changed(self, value):
         self.current_frame = value
@@ -444,10 +1698,11 @@ class HDF5Viewer(QMainWindow):
         if tab_name not in self.images_dict:
             return
 
-        self.current_frame = 0
-        self.show_frame(self.current_frame)
+        ## Keep the current tick so cameras can be compared frame by frame
         self.slider.setMaximum(self.images_dict[tab_name].shape[0] - 1)
-        self.slider.setValue(0)
+        self.current_frame = min(self.current_frame, self.images_dict[tab_name].shape[0] - 1)
+        self.show_frame(self.current_frame)
+        self.request_filmstrip()
 
     def toggle_dock_visibility(self):
         if self.dock.isVisible():
@@ -455,41 +1710,229 @@ class HDF5Viewer(QMainWindow):
         else:
             self.dock.show()
 
-    def plot_reward(self):
+    def set_frame_cache_size(self):
+        size_mb, ok = QInputDialog.getInt(self, "Frame Cache", "Frame cache size (MB):", self.frame_cache.max_bytes // (1024 * 1024), 0, 65536)
+        if ok:
+            self.frame_cache.set_max_bytes(size_mb * 1024 * 1024)
+            self.update_cache_label()
+
+    def update_cache_label(self):
+        cache = self.frame_cache
+        self.cache_label.setText(f"Cache: {cache.hits} hits / {cache.misses} misses / {cache.total_bytes / (1024 * 1024):.0f} of {cache.max_bytes / (1024 * 1024):.0f} MB")
+
+    def populate_signals(self):
+        signals = robros_core.list_signals(self.hdf5_file)
+        columns = {}
+        for dataset_path, column in signals:
+            columns[dataset_path] = columns.get(dataset_path, 0) + 1
+
+        self.signal_combo.blockSignals(True)
+        self.signal_combo.clear()
+        for dataset_path, column in signals:
+            label = dataset_path if column is None or columns[dataset_path] == 1 else f"{dataset_path}[{column}]"
+            self.signal_combo.addItem(label, (dataset_path, column))
+        if not signals:
+            self.signal_combo.addItem("None", None)
+        default_index = self.signal_combo.findText('rewards/task')
+        self.signal_combo.setCurrentIndex(max(0, default_index))
+        self.signal_combo.blockSignals(False)
+
+    def plot_signal(self):
         self.plot_widget.clear()
+        self.signal_data = None
+        self.signal_key = None
 
-        if not hasattr(self, 'reward_data') or not self.should_plot_reward:
-            x_data = np.arange(self.total_frames)
-            reward_data_flat = np.zeros_like(x_data)
+        signal = self.signal_combo.currentData() if hasattr(self, 'hdf5_file') else None
+        if signal is None:
+            self.signal_length = self.total_frames if hasattr(self, 'hdf5_file') else 0
             color = QColor('#FFFFFF')
+            label = 'None'
         else:
-            x_data = np.arange(self.reward_data.shape[0])
-            reward_data_flat = self.reward_data.flatten()
-            color = QColor('#FFFF00')
+            dataset_path, self.signal_column = signal
+            if dataset_path == 'rewards/task' and self.reward_data is not None:
+                self.signal_data = self.reward_data
+            else:
+                self.signal_data = robros_core.LazyArray(self.hdf5_file[dataset_path])
+            self.signal_length = self.signal_data.shape[0]
+            self.signal_key = (self.hdf5_file.filename, self.file_mtime, dataset_path, self.signal_column)
+            color = QColor('#FFFF00') if dataset_path == 'rewards/task' else QColor('#00FFFF')
             color.setAlpha(100)
+            label = self.signal_combo.currentText()
 
-        self.plot_widget.setEnabled(True)
+            if self.signal_key not in self.pyramids and self.signal_key not in self.pyramid_futures:
+                ## The worker gets its own view, LazyArray's chunk cache is not shared across threads
+                worker_data = robros_core.LazyArray(self.hdf5_file[dataset_path])
+                self.pyramid_futures[self.signal_key] = self.pyramid_executor.submit(robros_core.MinMaxPyramid.build, worker_data, self.signal_column)
+                QTimer.singleShot(50, self.poll_pyramids)
 
-        label = 'Reward'
-        curve = self.plot_widget.plot(x_data, reward_data_flat, pen=pg.mkPen(color=color, width=2), name=label)
+        self.plot_widget.setEnabled(True)
 
-        zero_curve = pg.PlotDataItem(x_data, np.zeros_like(x_data), pen=pg.mkPen(None))
+        self.signal_curve = self.plot_widget.plot(pen=pg.mkPen(color=color, width=2), name=label)
+        self.zero_curve = pg.PlotDataItem(pen=pg.mkPen(None))
 
-        fill = pg.FillBetweenItem(curve, zero_curve, brush=pg.mkBrush(color))
+        fill = pg.FillBetweenItem(self.signal_curve, self.zero_curve, brush=pg.mkBrush(color))
         self.plot_widget.addItem(fill)
 
         self.plot_widget.addItem(self.frame_line)
-        self.plot_widget.enableAutoRange()
+        self.update_markers()
+        self.plot_widget.enableAutoRange(axis='y')
+
+        last_frame = max(1, self.signal_length - 1)
+        self.plot_widget.setLimits(xMin=0, xMax=last_frame)
+        self.plot_widget.setXRange(0, last_frame, padding=0)
+        self.redraw_signal()
+
+    def redraw_signal(self):
+        if self.signal_curve is None:
+            return
+
+        if self.signal_data is None:
+            x_data = np.array([0, max(0, self.signal_length - 1)])
+            y_data = np.zeros(2)
+        else:
+            ## Redraws read the pyramid level with ~2 points per pixel, or raw samples once zoomed in that far
+            (x_min, x_max), _ = self.plot_widget.viewRange()
+            start = max(0, int(x_min))
+            stop = min(self.signal_length, int(np.ceil(x_max)) + 1)
+            pixels = max(1, self.plot_widget.width())
+            pyramid = self.pyramids.get(self.signal_key)
+            envelope = pyramid.query(start, stop, pixels) if pyramid is not None else None
+
+            if envelope is not None:
+                x_data, y_data = envelope
+            elif pyramid is not None or stop - start <= 4 * pixels:
+                x_data = np.arange(start, stop)
+                y_data = np.asarray(self.signal_data[start:stop], dtype=np.float64)
+                if y_data.ndim > 1:
+                    y_data = y_data.reshape(len(y_data), -1)[:, self.signal_column or 0]
+            else:
+                ## Still building, the envelope is drawn as soon as the pyramid is ready
+                x_data = np.array([start])
+                y_data = np.zeros(1)
+
+        self.signal_curve.setData(x_data, y_data)
+        self.zero_curve.setData([x_data[0], x_data[-1]], [0, 0])
+        self.update_filmstrip_view()
+
+    def poll_pyramids(self):
+        for key, future in list(self.pyramid_futures.items()):
+            if not future.done():
+                continue
+            del self.pyramid_futures[key]
+            try:
+                self.pyramids[key] = future.result()
+            except Exception:
+                continue
+            while len(self.pyramids) > MAX_CACHED_PYRAMIDS:
+                self.pyramids.popitem(last=False)
+            if key == self.signal_key:
+                self.redraw_signal()
+
+        if self.pyramid_futures:
+            QTimer.singleShot(50, self.poll_pyramids)
+
+    def request_filmstrip(self):
+        current_tab_name = self.tab_widget.tabText(self.tab_widget.currentIndex())
+        if not hasattr(self, 'hdf5_file') or current_tab_name not in self.images_dict:
+            return
+
+        key = (self.hdf5_file.filename, current_tab_name)
+        if key != self.filmstrip_key:
+            self.release_filmstrip()
+        num_frames = self.images_dict[current_tab_name].shape[0]
+        step = self.thumbnail_interval or max(1, -(-num_frames // MAX_STRIP_THUMBNAILS))
+        self.filmstrip_key = key
+        self.filmstrip.set_thumbnails(self.thumbnails.request(*key, range(0, num_frames, step)), step)
+        self.poll_thumbnails()
+
+    def release_filmstrip(self):
+        if self.filmstrip_key is not None:
+            self.thumbnails.release(self.filmstrip_key)
+            self.filmstrip_key = None
+        self.filmstrip.set_thumbnails({}, 1)
+
+    def request_contact_thumbnail(self, file_name):
+        ## The file list shows the first frame of the first camera, from the same cache as the strip
+        cameras = self.episode_info.get(file_name, {}).get('cameras') or {}
+        camera = next((name for name, camera in cameras.items() if camera['frames'] > 0), None)
+        if camera is None:
+            return
+        self.contact_cameras[file_name] = camera
+        if 0 in self.thumbnails.request(file_name, camera, [0]):
+            self.set_contact_icons({file_name})
+        self.poll_thumbnails()
+
+    def set_contact_icons(self, file_names):
+        for row in range(self.file_table_widget.rowCount()):
+            file_item = self.file_table_widget.item(row, 0)
+            file_name = file_item.data(Qt.ItemDataRole.UserRole)
+            image = self.thumbnails.images.get((file_name, self.contact_cameras.get(file_name)), {}).get(0)
+            if file_name in file_names and image is not None:
+                file_item.setIcon(QIcon(QPixmap.fromImage(image)))
+
+    def poll_thumbnails(self):
+        if self.thumbnail_poll_scheduled:
+            return
+        self.thumbnail_poll_scheduled = True
+        QTimer.singleShot(100, self.collect_thumbnails)
+
+    def collect_thumbnails(self):
+        self.thumbnail_poll_scheduled = False
+        updated = self.thumbnails.poll()
+        if self.filmstrip_key in updated:
+            self.filmstrip.set_thumbnails(self.thumbnails.images[self.filmstrip_key], self.filmstrip.step)
+
+        contact_files = {key[0] for key in updated if self.contact_cameras.get(key[0]) == key[1]}
+        if contact_files:
+            self.set_contact_icons(contact_files)
+
+        if self.thumbnails.pending():
+            self.poll_thumbnails()
+
+    def update_filmstrip_view(self):
+        view_box = self.plot_widget.getPlotItem().getViewBox()
+        (x_min, x_max), _ = view_box.viewRange()
+        rect = view_box.sceneBoundingRect()
+        left = self.filmstrip.mapFromGlobal(self.plot_widget.mapToGlobal(self.plot_widget.mapFromScene(rect.topLeft()))).x()
+        right = self.filmstrip.mapFromGlobal(self.plot_widget.mapToGlobal(self.plot_widget.mapFromScene(rect.topRight()))).x()
+        self.filmstrip.set_view(x_min, x_max, left, right)
+
+    def filmstrip_clicked(self, frame_index):
+        current_tab_name = self.tab_widget.tabText(self.tab_widget.currentIndex())
+        if current_tab_name not in self.images_dict:
+            return
+        self.current_frame = min(max(0, frame_index), self.images_dict[current_tab_name].shape[0] - 1)
+        self.show_frame(self.current_frame)
+
+    def set_thumbnail_interval(self):
+        interval, ok = QInputDialog.getInt(self, "Thumbnail Interval", "Frames between thumbnails (0 for automatic):", self.thumbnail_interval, 0, 100000)
+        if ok:
+            self.thumbnail_interval = interval
+            self.request_filmstrip()
 
-        self.plot_widget.setXRange(0, len(x_data) - 1, padding=0)
+    def closeEvent(self, event):
+        self.timer.stop()
+        self.prefetcher.shutdown()
+        self.pyramid_executor.shutdown(wait=False, cancel_futures=True)
+        self.thumbnails.shutdown()
+        self.close_file()
+        super().closeEvent(event)
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key.Key_Space:
-            self.toggle_play()
+            self.toggle_play(-1 if event.modifiers() & Qt.KeyboardModifier.ShiftModifier else 1)
         if event.key() == Qt.Key.Key_Right:
             self.toggle_one_frame_forward()
         if event.key() == Qt.Key.Key_Left:
             self.toggle_one_frame_backward()
+        if event.key() == Qt.Key.Key_P:
+            self.profiler_action.toggle()
+        if event.key() == Qt.Key.Key_G:
+            self.grid_view_action.toggle()
+        if event.key() == Qt.Key.Key_I:
+            self.set_mark_in()
+        if event.key() == Qt.Key.Key_O:
+            self.set_mark_out()
 
     def toggle_one_frame_forward(self):
         if not hasattr(self, 'images_dict') or not self.images_dict:
@@ -497,6 +1940,7 @@ class HDF5Viewer(QMainWindow):
 
         current_tab_name = self.tab_widget.tabText(self.tab_widget.currentIndex())
         if current_tab_name in self.images_dict:
+            self.play_direction = 1
             self.current_frame = (self.current_frame + 1) % self.images_dict[current_tab_name].shape[0]
             self.show_frame(self.current_frame)
 
@@ -506,6 +1950,7 @@ class HDF5Viewer(QMainWindow):
 
         current_tab_name = self.tab_widget.tabText(self.tab_widget.currentIndex())
         if current_tab_name in self.images_dict:
+            self.play_direction = -1
             self.current_frame = (self.current_frame - 1) % self.images_dict[current_tab_name].shape[0]
             self.show_frame(self.current_frame)
 
@@ -520,6 +1965,11 @@ class HDF5Viewer(QMainWindow):
         if current_tab_name in self.images_dict:
             max_frame = self.images_dict[current_tab_name].shape[0] - 1
             if 0 <= x_pos <= max_frame:
+                ## Shift-click sets the in marker, Ctrl-click the out marker
+                if event.modifiers() & Qt.KeyboardModifier.ShiftModifier:
+                    self.set_mark_in(x_pos)
+                elif event.modifiers() & Qt.KeyboardModifier.ControlModifier:
+                    self.set_mark_out(x_pos)
                 self.current_frame = x_pos
                 self.show_frame(self.current_frame)
                 self.slider.setValue(self.current_frame)
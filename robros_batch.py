@@ -0,0 +1,301 @@
+## Description: Headless batch tools for ROBROS IL datasets, sharing robros_core with the editor
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import h5py
+import robros_core
+import robros_stats
+import robros_qc
+import robros_search
+
+JOURNAL_FILE_NAME = '.robros_batch.json'
+REPORT_FILE_NAME = 'robros_batch_report.json'
+
+def load_journal(journal_path):
+    try:
+        with open(journal_path, 'r') as journal_file:
+            return json.load(journal_file)
+    except (OSError, ValueError):
+        return {}
+
+def save_journal(journal_path, journal):
+    temp_path = f"{journal_path}.tmp"
+    with open(temp_path, 'w') as journal_file:
+        json.dump(journal, journal_file, indent=1)
+    os.replace(temp_path, journal_path)
+
+def is_done(entry, spec, source_path, output_path):
+    if not entry or entry.get('status') != 'done' or entry.get('spec') != spec:
+        return False
+    if not os.path.exists(output_path) or not os.path.exists(source_path):
+        return False
+
+    output_stat = os.stat(output_path)
+    if (output_stat.st_mtime, output_stat.st_size) != (entry['output_mtime'], entry['output_size']):
+        return False
+    ## An in-place edit leaves the source looking like the recorded output
+    source_stat = os.stat(source_path)
+    return (source_stat.st_mtime, source_stat.st_size) in ((entry['source_mtime'], entry['source_size']), (entry['output_mtime'], entry['output_size']))
+
+def run_edit(input_dir, output_dir, spec, workers=None, restart=False, log=print):
+    os.makedirs(output_dir, exist_ok=True)
+    journal_path = os.path.join(output_dir, JOURNAL_FILE_NAME)
+    journal = {} if restart else load_journal(journal_path)
+
+    names = [os.path.basename(file_name) for file_name in robros_core.list_episodes(input_dir)]
+    todo = []
+    skipped = []
+    for name in names:
+        if is_done(journal.get(name), spec, os.path.join(input_dir, name), os.path.join(output_dir, name)):
+            skipped.append(name)
+        else:
+            todo.append(name)
+
+    if skipped:
+        log(f"Skipping {len(skipped)} episodes already done")
+
+    start_time = time.time()
+    edited = []
+    failed = []
+    if todo:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(todo)), mp_context=context) as executor:
+            futures = {executor.submit(robros_core.edit_episode, os.path.join(input_dir, name), os.path.join(output_dir, name), spec): name for name in todo}
+            for done, future in enumerate(as_completed(futures)):
+                name = futures[future]
+                try:
+                    entry = dict(future.result(), status='done', spec=spec)
+                    edited.append(name)
+                except Exception as e:
+                    entry = {'status': 'failed', 'spec': spec, 'error': str(e)}
+                    failed.append(name)
+                journal[name] = entry
+                save_journal(journal_path, journal)
+                log(f"[{done + 1}/{len(todo)}] {name}: {entry['status']}" + (f" ({entry['error']})" if 'error' in entry else ""))
+
+    report = {
+        'input_dir': os.path.abspath(input_dir),
+        'output_dir': os.path.abspath(output_dir),
+        'spec': spec,
+        'episodes': len(names),
+        'edited': len(edited),
+        'skipped': len(skipped),
+        'failed': failed,
+        'bytes_in': sum(journal[name]['source_size'] for name in edited),
+        'bytes_out': sum(journal[name]['output_size'] for name in edited),
+        'missing_datasets': {name: journal[name]['missing'] for name in edited if journal[name]['missing']},
+        'elapsed': time.time() - start_time,
+    }
+    if spec.get('recompress'):
+        report['frames_encoded'] = sum(journal[name].get('frames_encoded', 0) for name in edited)
+        report['frames_failed'] = sum(journal[name].get('frames_failed', 0) for name in edited)
+        report['encode_seconds'] = sum(journal[name].get('encode_seconds', 0.0) for name in edited)
+        report['encode_fps'] = report['frames_encoded'] / report['encode_seconds'] if report['encode_seconds'] else 0.0
+        report['savings'] = 1 - report['bytes_out'] / report['bytes_in'] if report['bytes_in'] else 0.0
+    with open(os.path.join(output_dir, REPORT_FILE_NAME), 'w') as report_file:
+        json.dump(report, report_file, indent=1)
+    return report
+
+def build_spec(args):
+    spec = {}
+    if args.spec:
+        with open(args.spec, 'r') as spec_file:
+            spec = json.load(spec_file)
+    if args.keep:
+        spec['keep'] = args.keep
+    if args.drop:
+        spec['drop'] = args.drop
+    if args.frames:
+        spec['frames'] = robros_core.parse_frame_range(args.frames)
+    return spec
+
+def build_recompress(args):
+    recompress = {
+        'codec': None if args.codec == 'keep' else args.codec,
+        'quality': args.quality,
+        'max_size': robros_core.parse_size(args.max_size) if args.max_size else None,
+        'compression': None if args.compression == 'none' else args.compression,
+        'compression_level': args.compression_level,
+        ## Episodes already run in parallel processes, so each one gets its share of the cores for encoding
+        'threads': args.threads or max(1, (os.cpu_count() or 1) // (args.workers or os.cpu_count() or 1)),
+    }
+    if recompress['max_size'] and not recompress['codec']:
+        recompress['codec'] = 'jpeg'
+    robros_core.compression_filter(recompress['compression'], recompress['compression_level'])
+    return recompress
+
+def edit_command(args):
+    try:
+        spec = build_spec(args)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    report = run_edit(args.input_dir, args.output_dir or args.input_dir, spec, workers=args.workers, restart=args.restart)
+    print(f"{report['edited']} edited, {report['skipped']} skipped, {len(report['failed'])} failed, "
+          f"{report['bytes_in'] / 1e6:.1f} MB -> {report['bytes_out'] / 1e6:.1f} MB in {report['elapsed']:.1f}s")
+    return 1 if report['failed'] else 0
+
+def recompress_command(args):
+    try:
+        spec = build_spec(args)
+        spec['recompress'] = build_recompress(args)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    report = run_edit(args.input_dir, args.output_dir or args.input_dir, spec, workers=args.workers, restart=args.restart)
+    savings = f"{report['savings'] * 100:.1f}% smaller" if 'savings' in report else "nothing to do"
+    print(f"{report['edited']} recompressed, {report['skipped']} skipped, {len(report['failed'])} failed, "
+          f"{report['bytes_in'] / 1e6:.1f} MB -> {report['bytes_out'] / 1e6:.1f} MB ({savings})")
+    if report.get('frames_encoded'):
+        print(f"{report['frames_encoded']} frames encoded at {report['encode_fps']:.0f} frames/s per worker"
+              + (f", {report['frames_failed']} undecodable frames kept as they were" if report['frames_failed'] else ""))
+    return 1 if report['failed'] else 0
+
+def stats_command(args):
+    input_dir = args.input_dir
+    file_names = robros_core.list_episodes(input_dir)
+
+    def progress(done, total):
+        print(f"[{done}/{total}]", end='\r', file=sys.stderr, flush=True)
+
+    report = robros_stats.compute_stats(file_names, patterns=args.dataset, image_stride=args.image_stride, workers=args.workers, progress=progress)
+    print(file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            json.dump(report, report_file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    for name, error in report['failed'].items():
+        print(f"{name}: {error}", file=sys.stderr)
+    return 1 if report['failed'] else 0
+
+def qc_command(args):
+    input_dir = args.input_dir
+    file_names = robros_core.list_episodes(input_dir)
+
+    def progress(done, total):
+        print(f"[{done}/{total}]", end='\r', file=sys.stderr, flush=True)
+
+    results = robros_qc.check_files(file_names, full_decode=args.full_decode, frozen_frames=args.frozen_frames, workers=args.workers, progress=progress)
+    print(file=sys.stderr)
+    for entry in sorted(results.values(), key=lambda entry: (-robros_qc.SEVERITY[entry['status']], entry['name'])):
+        if entry['status'] != 'ok':
+            print(f"{entry['name']}: {robros_qc.summarize(entry)}")
+            for found in entry['issues']:
+                print(f"    {found['dataset'] or ''}: {found['message']}")
+
+    statuses = [entry['status'] for entry in results.values()]
+    print(f"{statuses.count('ok')} ok, {statuses.count('warning')} warnings, {statuses.count('error')} errors")
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            json.dump({os.path.basename(path): entry for path, entry in results.items()}, report_file, indent=1)
+    return 1 if 'error' in statuses else 0
+
+def search_command(args):
+    input_dir = args.input_dir
+    file_names = robros_core.list_episodes(input_dir)
+    query_file = os.path.abspath(args.like)
+
+    def progress(done, total):
+        print(f"[{done}/{total}]", end='\r', file=sys.stderr, flush=True)
+
+    entries = robros_search.index_files(file_names + [query_file], workers=args.workers, progress=progress)
+    print(file=sys.stderr)
+    index = robros_search.SearchIndex(entries)
+    if query_file not in index.entries:
+        print(f"{args.like}: {entries.get(query_file, {}).get('error', 'not indexed')}", file=sys.stderr)
+        return 2
+
+    exclude = None if args.include_query else query_file
+    if args.by == 'pose':
+        arrays = index.entries[query_file]['arrays']
+        if 'poses' not in arrays:
+            print(f"{args.like} has no {robros_search.POSE_DATASET}", file=sys.stderr)
+            return 2
+        with h5py.File(query_file, 'r') as hdf5_file:
+            dataset = hdf5_file[robros_search.POSE_DATASET]
+            if not 0 <= args.frame < dataset.shape[0]:
+                print(f"{args.like} has {dataset.shape[0]} frames", file=sys.stderr)
+                return 2
+            pose = dataset[args.frame]
+        hits = index.nearest_poses(pose, args.limit, exclude, not args.all_frames)
+    elif args.by == 'image':
+        camera = args.camera or next(iter(index.entries[query_file]['cameras']), None)
+        hits = index.similar_frames(camera, index.frame_hash(query_file, camera, args.frame), args.limit, exclude, not args.all_frames)
+    else:
+        hits = index.similar_episodes(query_file, args.by, args.limit)
+
+    for hit in hits:
+        print(f"{hit['distance']:>12.4g}  {os.path.basename(hit['file'])}" + (f"  frame {hit['frame']}" if args.by in ('pose', 'image') else ""))
+    for name, error in index.failed.items():
+        print(f"{name}: {error}", file=sys.stderr)
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless batch tools for ROBROS IL datasets")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_edit_arguments(edit_parser):
+        edit_parser.add_argument('input_dir')
+        edit_parser.add_argument('output_dir', nargs='?', help="Defaults to editing the episodes in place")
+        edit_parser.add_argument('--spec', help="JSON file with 'datasets', 'keep', 'drop' and 'frames' entries")
+        edit_parser.add_argument('--keep', action='append', help="Glob over dataset paths to keep, may be repeated")
+        edit_parser.add_argument('--drop', action='append', help="Glob over dataset paths to drop, may be repeated")
+        edit_parser.add_argument('--frames', help="Frame range START:STOP applied to every time-indexed dataset")
+        edit_parser.add_argument('--workers', type=int)
+        edit_parser.add_argument('--restart', action='store_true', help="Ignore the progress journal and redo every episode")
+
+    edit_parser = subparsers.add_parser('edit', help="Drop datasets and trim frame ranges across a directory of episodes")
+    add_edit_arguments(edit_parser)
+    edit_parser.set_defaults(func=edit_command)
+
+    recompress_parser = subparsers.add_parser('recompress', help="Re-encode image streams and compress the other datasets, with the same options as edit")
+    add_edit_arguments(recompress_parser)
+    recompress_parser.add_argument('--codec', choices=['keep'] + list(robros_core.IMAGE_CODECS), default='jpeg', help="Image codec, 'keep' copies the blobs as they are")
+    recompress_parser.add_argument('--quality', type=int, default=90, help="JPEG/WebP quality")
+    recompress_parser.add_argument('--max-size', help="Shrink images to fit WIDTHxHEIGHT, never upscaling")
+    recompress_parser.add_argument('--compression', choices=['none'] + list(robros_core.COMPRESSIONS), default='gzip', help="Filter for numeric datasets, blosc needs hdf5plugin")
+    recompress_parser.add_argument('--compression-level', type=int)
+    recompress_parser.add_argument('--threads', type=int, help="Encode threads per episode")
+    recompress_parser.set_defaults(func=recompress_command)
+
+    stats_parser = subparsers.add_parser('stats', help="Mean, std, min, max and quantiles of numeric datasets across a directory of episodes")
+    stats_parser.add_argument('input_dir')
+    stats_parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    stats_parser.add_argument('--dataset', action='append', help=f"Glob over dataset paths to summarize, may be repeated (default: {' '.join(robros_stats.DEFAULT_STAT_DATASETS)})")
+    stats_parser.add_argument('--image-stride', type=int, default=10, help="Sample every Nth frame for image brightness, 0 to skip images")
+    stats_parser.add_argument('--workers', type=int)
+    stats_parser.set_defaults(func=stats_command)
+
+    qc_parser = subparsers.add_parser('qc', help="Find undecodable frames, length mismatches, NaN/inf or frozen signals and duplicate frames")
+    qc_parser.add_argument('input_dir')
+    qc_parser.add_argument('--full-decode', action='store_true', help="Decode every JPEG instead of only checking its markers and header")
+    qc_parser.add_argument('--frozen-frames', type=int, default=robros_qc.DEFAULT_FROZEN_FRAMES, help="Flag xpos that stays identical for this many frames, 0 to skip")
+    qc_parser.add_argument('--output', help="Also write the full report as JSON")
+    qc_parser.add_argument('--workers', type=int)
+    qc_parser.set_defaults(func=qc_command)
+
+    search_parser = subparsers.add_parser('search', help="Rank frames or episodes by similarity to a query episode")
+    search_parser.add_argument('input_dir')
+    search_parser.add_argument('--like', required=True, help="Query episode")
+    search_parser.add_argument('--by', choices=['pose', 'image', 'trajectory', 'start'], default='trajectory',
+                               help="pose and image match one frame, trajectory and start match whole episodes")
+    search_parser.add_argument('--frame', type=int, default=0, help="Query frame for pose and image searches")
+    search_parser.add_argument('--camera', help="Camera for image searches, defaults to the first one")
+    search_parser.add_argument('--limit', type=int, default=robros_search.DEFAULT_LIMIT)
+    search_parser.add_argument('--all-frames', action='store_true', help="List every matching frame instead of the best one per episode")
+    search_parser.add_argument('--include-query', action='store_true', help="Also match frames from the query episode")
+    search_parser.add_argument('--workers', type=int)
+    search_parser.set_defaults(func=search_command)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+## Description: Headless benchmarks for the ROBROS IL dataset editor's hot paths on synthetic episodes
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import h5py
+import numpy as np
+import cv2
+import robros_core
+
+DISTINCT_FRAMES = 64
+
+def synthetic_frames(width, height, count, seed):
+    ## A moving gradient with a few blobs and sensor noise, close enough to camera JPEG sizes
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    centers = rng.uniform(0, 1, (4, 2)) * (width, height)
+    velocities = rng.uniform(-4, 4, (4, 2))
+    frames = []
+    for i in range(count):
+        image = np.empty((height, width, 3), dtype=np.float32)
+        image[..., 0] = 128 + 100 * np.sin((x + i * 3) / 97.0)
+        image[..., 1] = 128 + 100 * np.cos((y - i * 2) / 61.0)
+        image[..., 2] = 96
+        for center, velocity in zip(centers, velocities):
+            cx, cy = (center + velocity * i) % (width, height)
+            image[(x - cx) ** 2 + (y - cy) ** 2 < (min(width, height) / 10) ** 2] = (40, 200, 240)
+        image += rng.normal(0, 6, image.shape)
+        frames.append(np.clip(image, 0, 255).astype(np.uint8))
+    return frames
+
+def generate_episode(path, cameras=3, width=640, height=480, frames=500, chunk_frames=16, compression=None, num_objects=10, quality=90, seed=0):
+    ## Same layout the editor expects: observations/images/<cam> JPEG vlen blobs, observations/xpos, rewards/task, action
+    rng = np.random.default_rng(seed)
+    blobs = [np.frombuffer(cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes(), dtype=np.uint8)
+             for image in synthetic_frames(width, height, min(frames, DISTINCT_FRAMES), seed)]
+    chunks = (max(1, min(chunk_frames, frames)),) if chunk_frames else None
+
+    with h5py.File(path, 'w') as hdf5_file:
+        hdf5_file.attrs['fps'] = 30
+        images = hdf5_file.create_group('observations/images')
+        for camera in range(cameras):
+            dataset = images.create_dataset(f"cam_{camera}", (frames,), dtype=h5py.vlen_dtype(np.uint8), chunks=chunks, compression=compression)
+            rows = np.empty(frames, dtype=object)
+            rows[:] = [blobs[(i + camera * 7) % len(blobs)] for i in range(frames)]
+            robros_core.write_vlen_rows(dataset, 0, rows)
+
+        numeric_chunks = lambda width: (max(1, min(chunk_frames, frames)), width) if chunk_frames else None
+        xpos = np.cumsum(rng.normal(0, 2, (frames, num_objects * 3)), axis=0)
+        hdf5_file.create_dataset('observations/xpos', data=xpos, chunks=numeric_chunks(num_objects * 3), compression=compression)
+        reward = (np.arange(frames) > frames * 0.8).astype(np.float64)[:, None]
+        hdf5_file.create_dataset('rewards/task', data=reward, chunks=numeric_chunks(1), compression=compression)
+        hdf5_file.create_dataset('action', data=rng.normal(0, 1, (frames, 14)), chunks=numeric_chunks(14), compression=compression)
+    return path
+
+def measure(function, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    times = np.array(times)
+    return {'median_s': float(np.median(times)), 'min_s': float(times.min()), 'mean_s': float(times.mean()), 'repeat': repeat}, result
+
+def open_episode(path):
+    ## Headless equivalent of HDF5Viewer.load_file
+    with h5py.File(path, 'r') as hdf5_file:
+        images = {key: dataset for key, dataset in hdf5_file['observations/images'].items()}
+        shapes = {key: robros_core.read_image_shape(dataset) for key, dataset in images.items()}
+        robros_core.episode_length(hdf5_file)
+        robros_core.episode_rate(hdf5_file)
+        reward = robros_core.LazyArray(hdf5_file['rewards/task'])
+        xpos = robros_core.LazyArray(hdf5_file['observations/xpos'])
+        xpos[0]
+        robros_core.list_signals(hdf5_file)
+        reward.close()
+        xpos.close()
+    return shapes
+
+def decode_frames(path, frame_indices, reduction=1):
+    with h5py.File(path, 'r') as hdf5_file:
+        dataset = next(iter(hdf5_file['observations/images'].values()))
+        for frame_index in frame_indices:
+            robros_core.decode_image(dataset[frame_index], reduction)
+    return len(frame_indices)
+
+def run_benchmarks(paths, workdir, repeat, frames_per_pass, seed):
+    rng = np.random.default_rng(seed)
+    path = paths[0]
+    with h5py.File(path, 'r') as hdf5_file:
+        num_frames = robros_core.episode_length(hdf5_file)
+    sequential = list(range(min(frames_per_pass, num_frames)))
+    random_frames = rng.integers(0, num_frames, len(sequential)).tolist()
+    results = {}
+
+    def cold_scan():
+        for name in os.listdir(os.path.dirname(path)):
+            if name == robros_core.INDEX_FILE_NAME:
+                os.remove(os.path.join(os.path.dirname(path), name))
+        return robros_core.scan_files(paths)
+
+    results['scan_episode'], _ = measure(lambda: robros_core.scan_episode(path), repeat)
+    results['scan_files_cold'], _ = measure(cold_scan, repeat)
+    results['scan_files_indexed'], _ = measure(lambda: robros_core.scan_files(paths), repeat)
+    results['open_episode'], _ = measure(lambda: open_episode(path), repeat)
+
+    for reduction in (1, 2, 4, 8):
+        timing, _ = measure(lambda: decode_frames(path, random_frames[:32], reduction), repeat)
+        timing['per_frame_s'] = timing['median_s'] / len(random_frames[:32])
+        results[f"decode_frame_1_{reduction}"] = timing
+
+    timing, _ = measure(lambda: decode_frames(path, sequential), repeat)
+    timing['fps'] = len(sequential) / timing['median_s']
+    results['sequential_playback'] = timing
+
+    timing, _ = measure(lambda: decode_frames(path, random_frames), repeat)
+    timing['fps'] = len(random_frames) / timing['median_s']
+    results['random_seek'] = timing
+
+    output_path = os.path.join(workdir, 'export.hdf5')
+    timing, _ = measure(lambda: robros_core.edit_episode(path, output_path, {}), repeat)
+    timing['bytes'] = os.path.getsize(output_path)
+    results['save_export'] = timing
+
+    timing, _ = measure(lambda: robros_core.edit_episode(path, output_path, {'frames': [num_frames // 4, num_frames * 3 // 4]}), repeat)
+    timing['bytes'] = os.path.getsize(output_path)
+    results['save_trimmed'] = timing
+
+    return results
+
+def compare(report, baseline):
+    lines = []
+    for name, timing in report['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before:
+            lines.append(f"{name:<22}{before['median_s'] * 1000:>10.2f} ms{timing['median_s'] * 1000:>10.2f} ms{before['median_s'] / max(timing['median_s'], 1e-12):>8.2f}x")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ROBROS IL dataset editor's hot paths on synthetic episodes")
+    parser.add_argument('--cameras', type=int, default=3)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--frames', type=int, default=500)
+    parser.add_argument('--episodes', type=int, default=4, help="Episodes generated for the directory scan")
+    parser.add_argument('--chunk-frames', type=int, default=16, help="Frames per chunk, 0 for contiguous numeric datasets")
+    parser.add_argument('--compression', choices=['none', 'gzip', 'lzf'], default='none')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--frames-per-pass', type=int, default=200, help="Frames decoded by the playback and seek passes")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help="Where episodes are generated, defaults to a temporary directory that is removed afterwards")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--compare', help="Baseline JSON report to print speedups against")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='robros_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    compression = None if args.compression == 'none' else args.compression
+    config = {key: value for key, value in vars(args).items() if key not in ('workdir', 'output', 'compare')}
+
+    try:
+        episode_dir = os.path.join(workdir, 'episodes')
+        os.makedirs(episode_dir, exist_ok=True)
+        start = time.perf_counter()
+        paths = [generate_episode(os.path.join(episode_dir, f"episode_{i:03d}.hdf5"), cameras=args.cameras, width=args.width, height=args.height,
+                                  frames=args.frames, chunk_frames=args.chunk_frames, compression=compression, seed=args.seed + i)
+                 for i in range(args.episodes)]
+        generate_time = time.perf_counter() - start
+
+        report = {
+            'config': config,
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'numpy': np.__version__,
+                'h5py': h5py.__version__,
+                'hdf5': h5py.version.hdf5_version,
+                'opencv': cv2.__version__,
+            },
+            'episode_bytes': os.path.getsize(paths[0]),
+            'generate_s': generate_time,
+            'results': run_benchmarks(paths, workdir, args.repeat, args.frames_per_pass, args.seed),
+        }
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            json.dump(report, report_file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            print(compare(report, json.load(baseline_file)), file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
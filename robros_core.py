@@ -0,0 +1,854 @@
+## Description: GUI-free helpers shared by the ROBROS IL dataset editor and its batch tools
+
+import os
+import csv
+import json
+import time
+import threading
+import fnmatch
+import shutil
+import tempfile
+import posixpath
+import multiprocessing
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import h5py
+import numpy as np
+import cv2
+
+try:
+    ## Registers the blosc filter with HDF5, needed both to write and to read blosc-compressed episodes
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+INDEX_FILE_NAME = '.robros_index.json'
+INDEX_VERSION = 2
+
+THUMBNAIL_DIR_NAME = '.robros_thumbnails'
+THUMBNAIL_HEIGHT = 72
+THUMBNAIL_QUALITY = 80
+
+COPY_BLOCK_BYTES = 16 * 1024 * 1024
+COPY_BLOCK_ROWS_VLEN = 256
+
+RECODE_BLOCK_ROWS = 32
+FILTER_CHUNK_BYTES = 1024 * 1024
+FILTER_MIN_ELEMENTS = 1024
+IMAGE_CODECS = {
+    'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY),
+    'png': ('.png', None),
+}
+COMPRESSIONS = ('gzip', 'lzf', 'blosc')
+## One row per frame even when their length disagrees with the cameras', so a trim must cover them all
+TIME_INDEXED_PATTERNS = ('observations/images/*', 'observations/xpos', 'rewards/*', 'action*')
+
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+RATE_ATTRS = ('fps', 'frame_rate', 'framerate', 'rate', 'hz', 'control_freq', 'sample_rate')
+
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def jpeg_size(blob):
+    ## Read (height, width, channels) from the SOF segment without decoding the image
+    data = blob.tobytes() if isinstance(blob, np.ndarray) else bytes(blob)
+    if data[:2] != b"\xff\xd8":
+        return None
+
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        if marker in SOF_MARKERS:
+            height = int.from_bytes(data[i + 5:i + 7], 'big')
+            width = int.from_bytes(data[i + 7:i + 9], 'big')
+            return (height, width, data[i + 9])
+        i += 2 + int.from_bytes(data[i + 2:i + 4], 'big')
+
+    return None
+
+class StageProfiler:
+    ## Rolling per-stage wall times, safe to record from decode threads
+    def __init__(self, window=1000):
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+
+    def stats(self):
+        with self.lock:
+            samples = {name: np.array(values) * 1000 for name, values in self.samples.items() if values}
+        return {
+            name: {
+                'count': len(values),
+                'mean_ms': float(values.mean()),
+                'p50_ms': float(np.percentile(values, 50)),
+                'p95_ms': float(np.percentile(values, 95)),
+                'p99_ms': float(np.percentile(values, 99)),
+                'max_ms': float(values.max()),
+            }
+            for name, values in samples.items()
+        }
+
+    def dump(self, path):
+        ## .csv gets one row per stage, anything else is written as JSON
+        stats = self.stats()
+        if path.lower().endswith('.csv'):
+            with open(path, 'w', newline='') as stats_file:
+                writer = csv.writer(stats_file)
+                writer.writerow(['stage', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'])
+                for name, values in stats.items():
+                    writer.writerow([name] + [values[key] for key in ('count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')])
+        else:
+            with open(path, 'w') as stats_file:
+                json.dump(stats, stats_file, indent=1)
+
+class PlaybackClock:
+    ## Maps wall-clock time to an unwrapped frame position at rate * speed; the caller shows whatever
+    ## frame the clock points at, so frames that cannot be shown in time are dropped instead of slowing playback
+    def __init__(self, rate=30.0, speed=1.0, clock=time.perf_counter):
+        self.rate = rate
+        self.speed = speed
+        self.clock = clock
+        self.direction = 1
+        self.anchor_time = clock()
+        self.anchor_position = 0
+        self.dropped = 0
+        self.presented_times = deque(maxlen=240)
+
+    def start(self, position=0, direction=1):
+        self.direction = direction
+        self.anchor_time = self.clock()
+        self.anchor_position = position
+        self.dropped = 0
+        self.presented_times.clear()
+
+    def set_rate(self, rate=None, speed=None):
+        position = self.position()
+        if rate is not None:
+            self.rate = rate
+        if speed is not None:
+            self.speed = speed
+        self.anchor_time = self.clock()
+        self.anchor_position = position
+
+    def position(self):
+        return self.anchor_position + self.direction * int((self.clock() - self.anchor_time) * self.rate * self.speed)
+
+    def presented(self, step):
+        self.dropped += max(0, abs(step) - 1)
+        self.presented_times.append(self.clock())
+
+    def expected_step(self, interval):
+        ## Frames the clock moves between presented frames: one tick of `interval` seconds, or longer while presenting falls behind
+        period = interval
+        if self.fps() > 0:
+            period = max(period, 1 / self.fps())
+        return self.rate * self.speed * period
+
+    def fps(self):
+        if len(self.presented_times) < 2:
+            return 0.0
+        return (len(self.presented_times) - 1) / max(1e-9, self.presented_times[-1] - self.presented_times[0])
+
+class LazyArray:
+    ## Read-only view of a numeric dataset: contiguous uncompressed data is memory-mapped straight from the file,
+    ## anything else is read a chunk at a time through a small LRU of chunks
+    def __init__(self, dataset, cache_chunks=16, block_bytes=1024 * 1024):
+        self.dataset = dataset
+        self.shape = dataset.shape
+        self.dtype = dataset.dtype
+        self.ndim = dataset.ndim
+        self.cache_chunks = cache_chunks
+        self.chunks = OrderedDict()
+        self.memmap = None
+
+        offset = dataset.id.get_offset() if dataset.chunks is None else None
+        if offset is not None and dataset.dtype.kind in 'biuf' and dataset.id.get_create_plist().get_external_count() == 0:
+            self.memmap = np.memmap(dataset.file.filename, dtype=dataset.dtype, mode='r', offset=offset, shape=dataset.shape)
+
+        if dataset.chunks is not None:
+            self.chunk_rows = dataset.chunks[0]
+        else:
+            row_bytes = dataset.dtype.itemsize * int(np.prod(dataset.shape[1:], dtype=np.int64))
+            self.chunk_rows = max(1, block_bytes // max(1, row_bytes))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if self.memmap is not None:
+            return self.memmap[key]
+
+        rows, rest = (key[0], key[1:]) if isinstance(key, tuple) else (key, ())
+        if isinstance(rows, (int, np.integer)):
+            row = int(rows) + (self.shape[0] if rows < 0 else 0)
+            if not 0 <= row < self.shape[0]:
+                raise IndexError(f"Index {rows} out of range for {self.shape[0]} rows")
+            return self._chunk(row // self.chunk_rows)[(row % self.chunk_rows,) + rest]
+
+        if isinstance(rows, slice):
+            start, stop, step = rows.indices(self.shape[0])
+            first = start // self.chunk_rows
+            last = (stop - 1) // self.chunk_rows
+            if step == 1 and stop > start and last - first < self.cache_chunks:
+                blocks = [self._chunk(i) for i in range(first, last + 1)]
+                block = blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+                offset = first * self.chunk_rows
+                return block[(slice(start - offset, stop - offset),) + rest]
+
+        ## Large or strided windows go straight to h5py rather than through the chunk cache
+        return self.dataset[key]
+
+    def close(self):
+        self.memmap = None
+        self.chunks.clear()
+
+    def _chunk(self, index):
+        block = self.chunks.get(index)
+        if block is None:
+            block = self.dataset[index * self.chunk_rows:(index + 1) * self.chunk_rows]
+            block.flags.writeable = False
+            self.chunks[index] = block
+            if len(self.chunks) > self.cache_chunks:
+                self.chunks.popitem(last=False)
+        else:
+            self.chunks.move_to_end(index)
+        return block
+
+class MinMaxPyramid:
+    ## Level k holds the min and max of every 2 ** (k + 1) samples, so any view can be drawn from ~2 points per pixel
+    def __init__(self, length, level_mins, level_maxs):
+        self.length = length
+        self.level_mins = level_mins
+        self.level_maxs = level_maxs
+
+    @classmethod
+    def build(cls, data, column=None, block_rows=1 << 16):
+        length = data.shape[0]
+        mins = np.empty((length + 1) // 2, dtype=np.float32)
+        maxs = np.empty((length + 1) // 2, dtype=np.float32)
+        for offset in range(0, length, block_rows):
+            block = np.asarray(data[offset:offset + block_rows], dtype=np.float64)
+            if block.ndim > 1:
+                block = block.reshape(len(block), -1)[:, column or 0]
+            if len(block) % 2:
+                block = np.append(block, block[-1])
+            ## fmin/fmax skip NaNs unless both samples are NaN
+            mins[offset // 2:offset // 2 + len(block) // 2] = np.fmin(block[0::2], block[1::2])
+            maxs[offset // 2:offset // 2 + len(block) // 2] = np.fmax(block[0::2], block[1::2])
+
+        level_mins = [mins]
+        level_maxs = [maxs]
+        while len(level_mins[-1]) > 1:
+            mins, maxs = level_mins[-1], level_maxs[-1]
+            if len(mins) % 2:
+                mins = np.append(mins, mins[-1])
+                maxs = np.append(maxs, maxs[-1])
+            level_mins.append(np.fmin(mins[0::2], mins[1::2]))
+            level_maxs.append(np.fmax(maxs[0::2], maxs[1::2]))
+        return cls(length, level_mins, level_maxs)
+
+    def query(self, start, stop, pixels):
+        ## Returns (x, y) tracing the min/max envelope of [start, stop), or None when raw samples are cheaper
+        start = max(0, int(start))
+        stop = min(self.length, int(np.ceil(stop)))
+        samples_per_pixel = (stop - start) / max(1, pixels)
+        if stop <= start or samples_per_pixel <= 2:
+            return None
+
+        level = int(min(len(self.level_mins) - 1, max(0, np.floor(np.log2(samples_per_pixel)) - 1)))
+        bucket = 2 ** (level + 1)
+        first = start // bucket
+        last = -(-stop // bucket)
+        x = np.repeat(np.arange(first, last) * bucket + (bucket - 1) / 2, 2)
+        y = np.column_stack((self.level_mins[level][first:last], self.level_maxs[level][first:last])).ravel()
+        return x, y
+
+def list_signals(hdf5_file):
+    ## Numeric 1-D/2-D datasets indexed by frame, as (dataset path, column or None) pairs
+    num_frames = episode_length(hdf5_file)
+    signals = []
+    for dataset_path in list_datasets(hdf5_file):
+        dataset = hdf5_file[dataset_path]
+        if dataset.dtype.kind not in 'biuf' or dataset.ndim not in (1, 2) or not dataset.shape[0]:
+            continue
+        if num_frames is not None and dataset.shape[0] != num_frames:
+            continue
+        if dataset.ndim == 1:
+            signals.append((dataset_path, None))
+        else:
+            signals += [(dataset_path, column) for column in range(dataset.shape[1])]
+    return signals
+
+def decode_reduction(image_shape, width, height):
+    ## Largest JPEG DCT scale (1/2, 1/4, 1/8) that still covers a width x height view, so it is never upsampled
+    if not image_shape or width <= 0 or height <= 0:
+        return 1
+    ## KeepAspectRatio scaling shows the image at this fraction of its size
+    scale = min(width / image_shape[1], height / image_shape[0])
+    reduction = 1
+    for factor in (2, 4, 8):
+        if factor * scale <= 1:
+            reduction = factor
+    return reduction
+
+def decode_image(blob, reduction=1, rgb=False):
+    ## rgb=True returns the channel order Qt expects; OpenCV 4.10+ decodes straight to it, older builds swap in place
+    flags = REDUCED_DECODE_FLAGS[reduction]
+    if rgb and hasattr(cv2, 'IMREAD_COLOR_RGB'):
+        flags = (flags & ~cv2.IMREAD_COLOR) | cv2.IMREAD_COLOR_RGB
+    image = cv2.imdecode(np.frombuffer(blob, dtype=np.uint8), flags)
+    if image is None:
+        raise ValueError("Undecodable image")
+    if rgb and not hasattr(cv2, 'IMREAD_COLOR_RGB'):
+        cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+    return image
+
+def read_image_shape(dataset):
+    if dataset.shape[0] > 0 and dataset.dtype.kind == 'O':
+        return jpeg_size(dataset[0])
+    if dataset.ndim >= 3:
+        return tuple(dataset.shape[1:])
+    return None
+
+def scan_episode(file_name):
+    stat = os.stat(file_name)
+    with h5py.File(file_name, 'r') as hdf5_file:
+        cameras = {}
+        if 'observations/images' in hdf5_file:
+            images = hdf5_file['observations/images']
+            for key in images:
+                dataset = images[key]
+                image_shape = read_image_shape(dataset)
+                cameras[key] = {
+                    'frames': int(dataset.shape[0]),
+                    'shape': list(dataset.shape),
+                    'dtype': str(dataset.dtype),
+                    'image_shape': list(image_shape) if image_shape else None,
+                }
+
+        has_reward = 'rewards/task' in hdf5_file
+        has_xpos = 'observations/xpos' in hdf5_file
+
+        reward = None
+        if has_reward:
+            reward_data = hdf5_file['rewards/task'][:].astype(np.float64).ravel()
+            if reward_data.size:
+                reward = {
+                    'min': float(np.nanmin(reward_data)),
+                    'max': float(np.nanmax(reward_data)),
+                    'mean': float(np.nanmean(reward_data)),
+                    'sum': float(np.nansum(reward_data)),
+                    'final': float(reward_data[-1]),
+                }
+
+    lengths = [camera['frames'] for camera in cameras.values()]
+    data_count = common_length(lengths) or 0
+    return {
+        'name': os.path.basename(file_name),
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'cameras': cameras,
+        'data_count': data_count,
+        'length_mismatch': len(set(lengths)) > 1,
+        'has_reward': has_reward,
+        'has_xpos': has_xpos,
+        'reward': reward,
+    }
+
+def list_datasets(hdf5_file):
+    dataset_paths = []
+    hdf5_file.visititems(lambda name, obj: dataset_paths.append(name) if isinstance(obj, h5py.Dataset) else None)
+    return dataset_paths
+
+def select_datasets(hdf5_file, spec):
+    ## spec: {'datasets': [...]} for an explicit list, or 'keep'/'drop' glob patterns over dataset paths
+    if spec.get('datasets') is not None:
+        return list(spec['datasets'])
+
+    dataset_paths = list_datasets(hdf5_file)
+    if spec.get('keep'):
+        dataset_paths = [path for path in dataset_paths if any(fnmatch.fnmatchcase(path, pattern) for pattern in spec['keep'])]
+    return [path for path in dataset_paths if not any(fnmatch.fnmatchcase(path, pattern) for pattern in spec.get('drop') or [])]
+
+def parse_frame_range(text):
+    ## 'START:STOP' with python slice semantics, either side may be empty or negative
+    start, sep, stop = text.partition(':')
+    if not sep:
+        raise ValueError(f"Frame range '{text}' must look like START:STOP")
+    try:
+        frame_range = [int(start) if start.strip() else None, int(stop) if stop.strip() else None]
+    except ValueError:
+        raise ValueError(f"Frame range '{text}' must look like START:STOP with integer frames") from None
+    ## Only same-sign bounds can be checked before the episode length is known
+    if None not in frame_range and (frame_range[0] < 0) == (frame_range[1] < 0) and frame_range[0] >= frame_range[1]:
+        raise ValueError(f"Frame range '{text}' is empty, START must be before STOP")
+    return frame_range
+
+def parse_size(text):
+    ## 'WIDTHxHEIGHT', e.g. '640x480'
+    width, sep, height = text.lower().partition('x')
+    if not sep or not width.strip().isdigit() or not height.strip().isdigit():
+        raise ValueError(f"Size '{text}' must look like WIDTHxHEIGHT")
+    return [int(width), int(height)]
+
+def compression_filter(name, level=None):
+    ## h5py create_dataset keyword arguments for a compression name; blosc needs the optional hdf5plugin package
+    if not name or name == 'none':
+        return {}
+    if name == 'gzip':
+        return {'compression': 'gzip', 'compression_opts': 4 if level is None else level, 'shuffle': True}
+    if name == 'lzf':
+        return {'compression': 'lzf', 'shuffle': True}
+    if name == 'blosc':
+        if hdf5plugin is None:
+            raise ValueError("blosc compression needs the hdf5plugin package")
+        return dict(hdf5plugin.Blosc(cname='lz4', clevel=5 if level is None else level, shuffle=hdf5plugin.Blosc.SHUFFLE))
+    raise ValueError(f"Unknown compression '{name}'")
+
+def recode_image(blob, image_shape, recompress):
+    ## Decode, fit inside max_size without upscaling, and encode with the requested codec
+    codec = recompress.get('codec') or 'jpeg'
+    extension, quality_flag = IMAGE_CODECS[codec]
+    max_size = recompress.get('max_size')
+
+    reduction = 1
+    if max_size and image_shape:
+        reduction = decode_reduction(image_shape, max_size[0], max_size[1])
+    image = decode_image(blob, reduction)
+    if max_size:
+        scale = min(1.0, max_size[0] / image.shape[1], max_size[1] / image.shape[0])
+        if scale < 1:
+            image = cv2.resize(image, (max(1, round(image.shape[1] * scale)), max(1, round(image.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+
+    params = [quality_flag, int(recompress.get('quality', 90))] if quality_flag is not None else []
+    ok, encoded = cv2.imencode(extension, image, params)
+    if not ok:
+        raise ValueError(f"Could not encode {codec}")
+    return encoded.ravel()
+
+def _recode_block(blobs, image_shape, recompress):
+    ## Frames that fail to decode are kept as they are rather than dropped, so frame indices never shift
+    rows = []
+    failed = 0
+    for blob in blobs:
+        try:
+            rows.append(recode_image(blob, image_shape, recompress))
+        except (ValueError, cv2.error):
+            rows.append(blob)
+            failed += 1
+    return rows, failed
+
+def split_ranges(start, stop, split_points):
+    bounds = [start] + sorted(point for point in set(split_points) if start < point < stop) + [stop]
+    return [[bounds[i], bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+def episode_rate(hdf5_file):
+    ## Recording rate in Hz from the camera datasets' or the root attrs, None when the file does not say
+    sources = []
+    if 'observations/images' in hdf5_file:
+        sources += list(hdf5_file['observations/images'].values())
+    sources.append(hdf5_file)
+
+    for source in sources:
+        for name in RATE_ATTRS:
+            if name in source.attrs:
+                try:
+                    rate = float(np.asarray(source.attrs[name]).ravel()[0])
+                except (TypeError, ValueError, IndexError):
+                    continue
+                if rate > 0:
+                    return rate
+    return None
+
+def episode_length(hdf5_file):
+    if 'observations/images' not in hdf5_file:
+        return None
+    return common_length([dataset.shape[0] for dataset in hdf5_file['observations/images'].values()])
+
+def common_length(lengths):
+    ## The length most cameras agree on, the shorter one on a tie; mismatches are reported by robros_qc, not averaged
+    if not lengths:
+        return None
+    return max(sorted(set(lengths)), key=lengths.count)
+
+def format_frame_range(frame_range):
+    return ":".join("" if bound is None else str(bound) for bound in frame_range)
+
+def resolve_frame_range(source_file, dataset_paths, frame_range):
+    ## (start, stop) of frame_range within the episode, plus the time-indexed paths it applies to.
+    ## Every one of them is cut to the same frames, so a range that runs past any of them is refused
+    ## instead of leaving some datasets trimmed and others whole.
+    time_indexed = {}
+    num_frames = episode_length(source_file)
+    for dataset_path in dataset_paths:
+        if dataset_path not in source_file:
+            continue
+        dataset = source_file[dataset_path]
+        if not dataset.shape:
+            continue
+        if dataset.shape[0] == num_frames or any(fnmatch.fnmatchcase(dataset_path.strip('/'), pattern) for pattern in TIME_INDEXED_PATTERNS):
+            time_indexed[dataset_path] = dataset.shape[0]
+    if num_frames is None:
+        num_frames = common_length(list(time_indexed.values()))
+    if num_frames is None:
+        raise ValueError(f"Frame range {format_frame_range(frame_range)} given, but the episode has no time-indexed datasets")
+
+    start, stop, _ = slice(*frame_range).indices(num_frames)
+    if start >= stop:
+        raise ValueError(f"Frame range {format_frame_range(frame_range)} selects no frames of a {num_frames}-frame episode")
+    short = {dataset_path: length for dataset_path, length in time_indexed.items() if length < stop}
+    if short:
+        raise ValueError(f"Frames {start}:{stop} run past the end of " + ", ".join(f"'{dataset_path}' ({length} frames)" for dataset_path, length in short.items()))
+    return (start, stop), set(time_indexed)
+
+def edit_episode(source_path, output_path, spec):
+    ## spec may also hold 'recompress': {'codec', 'quality', 'max_size', 'compression', 'compression_level', 'threads'}
+    stat = os.stat(source_path)
+    with h5py.File(source_path, 'r') as source_file:
+        dataset_paths = select_datasets(source_file, spec)
+
+    stats = {}
+    missing = copy_datasets(source_path, output_path, dataset_paths, frame_range=spec.get('frames'), recompress=spec.get('recompress'), stats=stats)
+    output_stat = os.stat(output_path)
+    return dict(stats, **{
+        'source': os.path.abspath(source_path),
+        'output': os.path.abspath(output_path),
+        'datasets': len(dataset_paths) - len(missing),
+        'missing': missing,
+        'source_mtime': stat.st_mtime,
+        'source_size': stat.st_size,
+        'output_mtime': output_stat.st_mtime,
+        'output_size': output_stat.st_size,
+    })
+
+def copy_datasets(source_path, output_path, dataset_paths, frame_range=None, recompress=None, stats=None):
+    ## Streams the selected datasets into a temp file next to output_path and swaps it in atomically,
+    ## so output_path may be the source file itself. Returns the dataset paths missing from the source.
+    ## With recompress, image streams are re-encoded and numeric datasets rechunked with the given filter;
+    ## stats, if given, collects frames_encoded, frames_failed and encode_seconds.
+    output_path = os.path.abspath(output_path)
+    filters = compression_filter(recompress.get('compression'), recompress.get('compression_level')) if recompress else None
+    recode = bool(recompress) and bool(recompress.get('codec') or recompress.get('max_size'))
+    if stats is not None and recode:
+        stats.update(frames_encoded=0, frames_failed=0, encode_seconds=0.0)
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(output_path) + '.', suffix='.tmp', dir=os.path.dirname(output_path))
+    os.close(fd)
+
+    try:
+        with h5py.File(source_path, 'r') as source_file, h5py.File(temp_path, 'w') as output_file:
+            missing = [dataset_path for dataset_path in dataset_paths if dataset_path not in source_file]
+            _copy_attrs(source_file, output_file)
+
+            frames = None
+            time_indexed = set()
+            if frame_range is not None:
+                frames, time_indexed = resolve_frame_range(source_file, dataset_paths, frame_range)
+
+            executor = ThreadPoolExecutor(max_workers=recompress.get('threads') or os.cpu_count() or 1) if recode else None
+            for dataset_path in dataset_paths:
+                if dataset_path in missing:
+                    continue
+                source = source_file[dataset_path]
+                parent_path, name = posixpath.split(dataset_path.strip('/'))
+                group = _require_group(source_file, output_file, parent_path)
+                trimmed = frames is not None and dataset_path in time_indexed
+                start, stop = frames if trimmed else (0, source.shape[0] if source.shape else 0)
+                if recode and source.dtype.kind == 'O' and dataset_path.strip('/').startswith('observations/images/'):
+                    _recode_images(source, group, name, start, stop, recompress, executor, stats)
+                elif filters and source.dtype.kind in 'biuf' and source.ndim >= 1 and source.size >= FILTER_MIN_ELEMENTS:
+                    _copy_frames(source, group, name, start, stop, filters=filters)
+                elif trimmed:
+                    _copy_frames(source, group, name, *frames)
+                else:
+                    ## H5Ocopy moves the stored chunks as they are: layout, filters, vlen data and attrs are preserved
+                    source_file.copy(source, group, name=name)
+            if executor is not None:
+                executor.shutdown()
+
+        if os.path.exists(output_path):
+            shutil.copymode(output_path, temp_path)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return missing
+
+def _copy_frames(source, group, name, start, stop, filters=None):
+    ## Same creation properties (filters, fill value, chunk shape clamped to the new length), copied block by block.
+    ## filters replaces them with ~FILTER_CHUNK_BYTES chunks along the frame axis and the given compression.
+    length = stop - start
+    row_bytes = source.dtype.itemsize * int(np.prod(source.shape[1:], dtype=np.int64))
+    if filters is not None and length == 0:
+        ## Filters need chunks, and no chunk fits in an empty dataset
+        target = group.create_dataset(name, shape=(0,) + source.shape[1:], dtype=source.dtype)
+    elif filters is not None:
+        chunks = (max(1, min(length, FILTER_CHUNK_BYTES // max(1, row_bytes))),) + source.shape[1:]
+        target = group.create_dataset(name, shape=(length,) + source.shape[1:], dtype=source.dtype, chunks=chunks, **filters)
+    else:
+        dcpl = source.id.get_create_plist()
+        kwargs = {}
+        if source.chunks:
+            ## An empty output keeps the source chunk and an unlimited frame axis, since no chunk fits in zero rows
+            chunks = (min(source.chunks[0], length) or source.chunks[0],) + source.chunks[1:]
+            dcpl.set_chunk(chunks)
+            kwargs = {'chunks': chunks, 'maxshape': (None if source.maxshape[0] is None or not length else length,) + source.maxshape[1:]}
+        target = group.create_dataset(name, shape=(length,) + source.shape[1:], dtype=source.dtype, dcpl=dcpl, **kwargs)
+    _copy_attrs(source, target)
+
+    if source.dtype.kind == 'O':
+        block_rows = COPY_BLOCK_ROWS_VLEN
+    else:
+        block_rows = max(1, COPY_BLOCK_BYTES // max(1, row_bytes))
+    if source.chunks:
+        block_rows = max(source.chunks[0], block_rows // source.chunks[0] * source.chunks[0])
+
+    for offset in range(0, length, block_rows):
+        end = min(length, offset + block_rows)
+        if source.dtype.kind == 'O':
+            write_vlen_rows(target, offset, source[start + offset:start + end])
+        else:
+            target[offset:end] = source[start + offset:start + end]
+
+def _recode_images(source, group, name, start, stop, recompress, executor, stats):
+    ## Reads stay on this thread (h5py serializes them anyway) while blocks decode and encode on the pool;
+    ## at most two blocks per worker are in flight, and results are written back in frame order
+    length = stop - start
+    target = group.create_dataset(name, shape=(length,), dtype=source.dtype, chunks=(min(length, COPY_BLOCK_ROWS_VLEN),) if length else None)
+    _copy_attrs(source, target)
+    image_shape = read_image_shape(source)
+    max_pending = 2 * (recompress.get('threads') or os.cpu_count() or 1)
+    begin = time.perf_counter()
+    pending = deque()
+
+    def write_oldest():
+        offset, future = pending.popleft()
+        rows, failed = future.result()
+        write_vlen_rows(target, offset, rows)
+        if stats is not None:
+            stats['frames_encoded'] += len(rows) - failed
+            stats['frames_failed'] += failed
+
+    for offset in range(0, length, RECODE_BLOCK_ROWS):
+        blobs = source[start + offset:start + min(length, offset + RECODE_BLOCK_ROWS)]
+        pending.append((offset, executor.submit(_recode_block, blobs, image_shape, recompress)))
+        if len(pending) >= max_pending:
+            write_oldest()
+    while pending:
+        write_oldest()
+
+    if stats is not None:
+        stats['encode_seconds'] += time.perf_counter() - begin
+
+def write_vlen_rows(dataset, offset, rows):
+    ## h5py's __setitem__ turns equal-length blobs into a 2-D array and fails, so write through the low-level API
+    data = np.empty(len(rows), dtype=object)
+    data[:] = list(rows)
+    file_space = dataset.id.get_space()
+    file_space.select_hyperslab((offset,), (len(data),))
+    dataset.id.write(h5py.h5s.create_simple((len(data),)), file_space, data)
+
+def _require_group(source_file, output_file, group_path):
+    group = output_file
+    for name in filter(None, group_path.split('/')):
+        if name not in group:
+            group.create_group(name)
+            _copy_attrs(source_file[posixpath.join(group.name, name)], group[name])
+        group = group[name]
+    return group
+
+def _copy_attrs(source, target):
+    for key, value in source.attrs.items():
+        target.attrs[key] = value
+
+def load_index(directory):
+    try:
+        with open(os.path.join(directory, INDEX_FILE_NAME), 'r') as index_file:
+            index = json.load(index_file)
+    except (OSError, ValueError):
+        return {}
+
+    if index.get('version') != INDEX_VERSION:
+        return {}
+    return index.get('episodes', {})
+
+def save_index(directory, entries):
+    index_path = os.path.join(directory, INDEX_FILE_NAME)
+    temp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'w') as index_file:
+            json.dump({'version': INDEX_VERSION, 'episodes': entries}, index_file)
+        os.replace(temp_path, index_path)
+    except OSError:
+        ## Read-only dataset directories still work, they are just rescanned every time
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def thumbnail_path(file_name, camera):
+    directory, name = os.path.split(os.path.abspath(file_name))
+    return os.path.join(directory, THUMBNAIL_DIR_NAME, f"{name}.{camera}.npz")
+
+def load_thumbnails(file_name, camera, frames=None):
+    ## {frame: JPEG bytes as uint8} from the sidecar cache, empty when it is missing or older than the episode.
+    ## npz members are read lazily, so asking for a few frames does not read the whole strip.
+    try:
+        stat = os.stat(file_name)
+        with np.load(thumbnail_path(file_name, camera)) as cache:
+            if tuple(cache['source']) != (stat.st_mtime, stat.st_size):
+                return {}
+            if frames is None:
+                names = [name for name in cache.files if name.startswith('frame_')]
+            else:
+                names = [f"frame_{frame}" for frame in frames if f"frame_{frame}" in cache.files]
+            return {int(name[len('frame_'):]): cache[name] for name in names}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def save_thumbnails(file_name, camera, thumbnails):
+    ## Merges into whatever is cached for the current version of the episode and swaps the file in atomically
+    path = thumbnail_path(file_name, camera)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        stat = os.stat(file_name)
+        merged = load_thumbnails(file_name, camera)
+        merged.update(thumbnails)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp_path, 'wb') as cache_file:
+            np.savez(cache_file, source=np.array([stat.st_mtime, stat.st_size], dtype=np.float64),
+                     **{f"frame_{frame}": blob for frame, blob in merged.items()})
+        os.replace(temp_path, path)
+    except OSError:
+        ## Same as the index: read-only dataset directories just regenerate thumbnails each time
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def make_thumbnails(file_name, camera, frames, height=THUMBNAIL_HEIGHT):
+    ## Decodes each frame at the smallest JPEG scale covering `height` rows and re-encodes it as a small JPEG.
+    ## Undecodable frames are left out.
+    thumbnails = {}
+    with h5py.File(file_name, 'r') as hdf5_file:
+        dataset = hdf5_file[f'observations/images/{camera}']
+        image_shape = read_image_shape(dataset)
+        reduction = 1
+        if image_shape:
+            scale = height / image_shape[0]
+            reduction = decode_reduction(image_shape, image_shape[1] * scale, height)
+
+        for frame in frames:
+            if not 0 <= frame < dataset.shape[0]:
+                continue
+            try:
+                image = decode_image(dataset[frame], reduction) if dataset.dtype.kind == 'O' else np.asarray(dataset[frame])
+            except ValueError:
+                continue
+            width = max(1, round(image.shape[1] * height / image.shape[0]))
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+            thumbnails[frame] = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY])[1].ravel()
+    return thumbnails
+
+def map_episodes(file_names, function, args=(), workers=None, progress=None, on_result=None):
+    ## Calls on_result(path, function(path, *args)) for each episode as results arrive; function must not raise.
+    ## progress(done, total) returning False cancels the episodes not started yet.
+    file_names = list(file_names)
+    if len(file_names) == 1:
+        on_result(file_names[0], function(file_names[0], *args))
+        if progress:
+            progress(1, 1)
+    elif file_names:
+        ## spawn, not fork: a forked child could inherit an h5py lock held by one of the editor's decode threads
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(file_names)), mp_context=context) as executor:
+            futures = {executor.submit(function, file_name, *args): file_name for file_name in file_names}
+            for done, future in enumerate(as_completed(futures)):
+                on_result(futures[future], future.result())
+                if progress and progress(done + 1, len(file_names)) is False:
+                    for pending in futures:
+                        pending.cancel()
+                    break
+
+def map_cached_episodes(file_names, function, load_cache, save_cache, args=(), fresh=None, workers=None, progress=None):
+    ## map_episodes with a per-directory sidecar: load_cache(directory) -> {name: entry}, save_cache(directory, entries).
+    ## An entry is reused while fresh(entry, stat) holds, by default while the episode's mtime and size are unchanged;
+    ## results are cached when they carry an 'mtime'. Returns {path: entry} in the order of file_names.
+    file_names = list(dict.fromkeys(os.path.abspath(file_name) for file_name in file_names))
+    fresh = fresh or (lambda entry, stat: (entry.get('mtime'), entry.get('size')) == (stat.st_mtime, stat.st_size))
+    caches = {directory: load_cache(directory) for directory in dict.fromkeys(os.path.dirname(file_name) for file_name in file_names)}
+    results = {}
+    stale = []
+    for path in file_names:
+        entry = caches[os.path.dirname(path)].get(os.path.basename(path))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            ## function reports the missing file in its own entry format
+            stat = None
+        if entry and stat and fresh(entry, stat):
+            results[path] = entry
+        else:
+            stale.append(path)
+
+    def finished(path, entry):
+        results[path] = entry
+        if 'mtime' in entry:
+            caches[os.path.dirname(path)][os.path.basename(path)] = entry
+
+    map_episodes(stale, function, args, workers, progress, finished)
+
+    if stale:
+        for directory, entries in caches.items():
+            save_cache(directory, {name: entry for name, entry in entries.items() if os.path.exists(os.path.join(directory, name))})
+
+    return {path: results[path] for path in file_names if path in results}
+
+def scan_files(file_names, workers=None, progress=None):
+    ## Returns {path: entry}; entries with an "error" key could not be read
+    return map_cached_episodes(file_names, _scan_or_error, load_index, save_index, workers=workers, progress=progress)
+
+def list_episodes(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.hdf5'))
+
+def _scan_or_error(file_name):
+    try:
+        return scan_episode(file_name)
+    except Exception as e:
+        entry = {'name': os.path.basename(file_name), 'error': str(e)}
+        if os.path.exists(file_name):
+            stat = os.stat(file_name)
+            entry.update(mtime=stat.st_mtime, size=stat.st_size)
+        return entry
@@ -0,0 +1,202 @@
+## Description: Parallel quality checks for ROBROS IL episodes: broken JPEGs, length mismatches, bad or frozen signals, duplicate frames
+
+import os
+import json
+import hashlib
+import h5py
+import numpy as np
+import cv2
+import robros_core
+
+QC_FILE_NAME = '.robros_qc.json'
+QC_VERSION = 1
+
+NONFINITE_DATASETS = ('observations/xpos', 'rewards/task')
+## Sparse rewards legitimately sit still for most of an episode, so only xpos is checked for freezing
+FROZEN_DATASETS = ('observations/xpos',)
+DEFAULT_FROZEN_FRAMES = 30
+MAX_LISTED_FRAMES = 10
+
+SEVERITY = {'ok': 0, 'warning': 1, 'error': 2}
+CHECK_SEVERITY = {
+    'unreadable': 'error',
+    'no_images': 'error',
+    'length_mismatch': 'error',
+    'undecodable': 'error',
+    'nonfinite': 'error',
+    'frozen': 'warning',
+    'duplicate_frames': 'warning',
+}
+
+def find_runs(mask):
+    ## [start, stop) of every run of True in a 1-D boolean array
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(edges[0::2].tolist(), edges[1::2].tolist()))
+
+def jpeg_header_error(blob, image_shape):
+    ## Cheap structural check: SOI marker, EOI marker near the end (encoders may pad), and a SOF header matching the camera.
+    ## PNG and WebP streams written by recompress only get their signature checked, a full decode covers the rest.
+    head = blob[:16].tobytes()
+    if head.startswith(b"\x89PNG\r\n\x1a\n") or (head[:4] == b"RIFF" and head[8:12] == b"WEBP"):
+        return None
+    if len(blob) < 4 or blob[0] != 0xFF or blob[1] != 0xD8:
+        return "missing JPEG start marker"
+    if b"\xff\xd9" not in blob[-32:].tobytes():
+        return "missing JPEG end marker"
+    size = robros_core.jpeg_size(blob)
+    if size is None:
+        return "missing JPEG frame header"
+    if image_shape and tuple(size) != tuple(image_shape):
+        return f"frame is {size[1]}x{size[0]}, camera is {image_shape[1]}x{image_shape[0]}"
+    return None
+
+def issue(check, dataset_path, message, frames=None, count=None):
+    entry = {'check': check, 'severity': CHECK_SEVERITY[check], 'dataset': dataset_path, 'message': message}
+    if frames is not None:
+        entry['count'] = count if count is not None else len(frames)
+        entry['frames'] = [int(frame) for frame in frames[:MAX_LISTED_FRAMES]]
+    return entry
+
+def check_camera(dataset, dataset_path, full_decode):
+    issues = []
+    if dataset.dtype.kind != 'O':
+        return issues
+
+    image_shape = robros_core.read_image_shape(dataset)
+    bad_frames = []
+    reasons = {}
+    duplicates = np.zeros(dataset.shape[0], dtype=bool)
+    previous = None
+    for offset in range(0, dataset.shape[0], robros_core.COPY_BLOCK_ROWS_VLEN):
+        for i, blob in enumerate(dataset[offset:offset + robros_core.COPY_BLOCK_ROWS_VLEN]):
+            frame_index = offset + i
+            error = jpeg_header_error(blob, image_shape)
+            if error is None and full_decode and cv2.imdecode(blob, cv2.IMREAD_UNCHANGED) is None:
+                error = "cv2.imdecode failed"
+            if error is not None:
+                bad_frames.append(frame_index)
+                reasons.setdefault(error, frame_index)
+
+            digest = hashlib.blake2b(blob, digest_size=16).digest()
+            duplicates[frame_index] = digest == previous
+            previous = digest
+
+    if bad_frames:
+        issues.append(issue('undecodable', dataset_path, "; ".join(f"{reason} (frame {frame})" for reason, frame in reasons.items()), bad_frames))
+    if duplicates.any():
+        runs = find_runs(duplicates)
+        longest = max(stop - start for start, stop in runs)
+        issues.append(issue('duplicate_frames', dataset_path, f"{int(duplicates.sum())} of {dataset.shape[0]} frames repeat the previous one, longest run {longest + 1} frames",
+                            [start - 1 for start, _ in runs], len(runs)))
+    return issues
+
+def check_signal(dataset, dataset_path, frozen_frames):
+    ## Reads a chunk at a time and keeps one flag per frame, never the data itself
+    issues = []
+    num_frames = dataset.shape[0]
+    nonfinite = np.zeros(num_frames, dtype=bool)
+    same = np.zeros(max(0, num_frames - 1), dtype=bool)
+    block_rows = dataset.chunks[0] if dataset.chunks is not None else max(1, robros_core.COPY_BLOCK_BYTES // max(1, dataset.dtype.itemsize * int(np.prod(dataset.shape[1:], dtype=np.int64))))
+    last_row = None
+    for offset in range(0, num_frames, block_rows):
+        rows = np.asarray(dataset[offset:offset + block_rows], dtype=np.float64).reshape(-1, int(np.prod(dataset.shape[1:], dtype=np.int64)))
+        nonfinite[offset:offset + len(rows)] = ~np.isfinite(rows).all(axis=1)
+        if last_row is not None:
+            rows = np.concatenate((last_row, rows))
+            same[offset - 1:offset - 1 + len(rows) - 1] = (rows[1:] == rows[:-1]).all(axis=1)
+        else:
+            same[:len(rows) - 1] = (rows[1:] == rows[:-1]).all(axis=1)
+        last_row = rows[-1:]
+
+    if nonfinite.any():
+        issues.append(issue('nonfinite', dataset_path, f"{int(nonfinite.sum())} of {num_frames} frames contain NaN or inf", np.flatnonzero(nonfinite)))
+    if frozen_frames and dataset_path in FROZEN_DATASETS:
+        frozen = [(start, stop + 1) for start, stop in find_runs(same) if stop + 1 - start >= frozen_frames]
+        if frozen:
+            issues.append(issue('frozen', dataset_path, "unchanged for " + ", ".join(f"frames {start}-{stop - 1}" for start, stop in frozen[:MAX_LISTED_FRAMES]),
+                                [start for start, _ in frozen], len(frozen)))
+    return issues
+
+def check_episode(file_name, full_decode=False, frozen_frames=DEFAULT_FROZEN_FRAMES):
+    stat = os.stat(file_name)
+    issues = []
+    with h5py.File(file_name, 'r') as hdf5_file:
+        lengths = {}
+        if 'observations/images' in hdf5_file:
+            for key, dataset in hdf5_file['observations/images'].items():
+                lengths[key] = dataset.shape[0]
+                issues += check_camera(dataset, f'observations/images/{key}', full_decode)
+        else:
+            issues.append(issue('no_images', None, "no observations/images group"))
+
+        if len(set(lengths.values())) > 1:
+            issues.append(issue('length_mismatch', 'observations/images', "cameras differ in length: " + ", ".join(f"{key} {length}" for key, length in lengths.items())))
+
+        num_frames = robros_core.episode_length(hdf5_file)
+        for dataset_path in NONFINITE_DATASETS:
+            if dataset_path not in hdf5_file:
+                continue
+            dataset = hdf5_file[dataset_path]
+            if num_frames is not None and dataset.shape[0] != num_frames:
+                issues.append(issue('length_mismatch', dataset_path, f"{dataset.shape[0]} frames, cameras have {num_frames}"))
+            if dataset.dtype.kind in 'biuf' and dataset.shape[0]:
+                issues += check_signal(dataset, dataset_path, frozen_frames)
+
+    return {
+        'name': os.path.basename(file_name),
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'options': {'full_decode': full_decode, 'frozen_frames': frozen_frames},
+        'status': max((issue['severity'] for issue in issues), key=SEVERITY.get, default='ok'),
+        'issues': issues,
+    }
+
+def _check_or_error(file_name, full_decode, frozen_frames):
+    try:
+        return check_episode(file_name, full_decode, frozen_frames)
+    except Exception as e:
+        return {
+            'name': os.path.basename(file_name),
+            'options': {'full_decode': full_decode, 'frozen_frames': frozen_frames},
+            'status': 'error',
+            'issues': [issue('unreadable', None, str(e))],
+        }
+
+def load_results(directory):
+    try:
+        with open(os.path.join(directory, QC_FILE_NAME), 'r') as qc_file:
+            results = json.load(qc_file)
+    except (OSError, ValueError):
+        return {}
+
+    if results.get('version') != QC_VERSION:
+        return {}
+    return results.get('episodes', {})
+
+def save_results(directory, entries):
+    qc_path = os.path.join(directory, QC_FILE_NAME)
+    temp_path = f"{qc_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'w') as qc_file:
+            json.dump({'version': QC_VERSION, 'episodes': entries}, qc_file)
+        os.replace(temp_path, qc_path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def check_files(file_names, full_decode=False, frozen_frames=DEFAULT_FROZEN_FRAMES, workers=None, progress=None):
+    ## Returns {path: entry}; results are cached next to the episodes and reused while the file and options are unchanged
+    options = {'full_decode': full_decode, 'frozen_frames': frozen_frames}
+    fresh = lambda entry, stat: entry.get('options') == options and (entry.get('mtime'), entry.get('size')) == (stat.st_mtime, stat.st_size)
+    return robros_core.map_cached_episodes(file_names, _check_or_error, load_results, save_results, args=(full_decode, frozen_frames),
+                                           fresh=fresh, workers=workers, progress=progress)
+
+def summarize(entry):
+    ## One line for tables and logs, e.g. "error: undecodable (3), frozen (1)"
+    if not entry['issues']:
+        return entry['status']
+    checks = {}
+    for found in entry['issues']:
+        checks[found['check']] = checks.get(found['check'], 0) + found.get('count', 1)
+    return f"{entry['status']}: " + ", ".join(f"{check} ({count})" for check, count in checks.items())
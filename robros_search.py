@@ -0,0 +1,239 @@
+## Description: Cross-episode search for ROBROS IL episodes: nearest poses, similar-looking frames and similar trajectories
+
+import os
+import json
+import h5py
+import numpy as np
+import cv2
+import robros_core
+
+SEARCH_FILE_NAME = '.robros_search.npz'
+SEARCH_VERSION = 1
+
+POSE_DATASET = 'observations/xpos'
+## Same cap as the filmstrip's automatic interval, so indexing and the strip share the thumbnail cache
+MAX_INDEXED_FRAMES = 200
+TRAJECTORY_SAMPLES = 32
+START_FRAMES = 60
+HASH_SIZE = 8
+DEFAULT_LIMIT = 20
+
+## Whole episode, or only its first START_FRAMES frames
+EPISODE_KINDS = ('trajectory', 'start')
+
+def frame_stride(num_frames, max_frames=MAX_INDEXED_FRAMES):
+    return max(1, -(-num_frames // max_frames))
+
+def perceptual_hash(image):
+    ## 64-bit pHash: the lowest 8x8 DCT coefficients of a 32x32 grayscale image, each compared with their median
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:HASH_SIZE, :HASH_SIZE].ravel()
+    ## The DC term only tracks overall brightness, so it is left out of the median
+    bits = low > np.median(low[1:])
+    return np.packbits(bits).view('>u8').astype(np.uint64)[0]
+
+def hamming(hashes, query):
+    diff = np.bitwise_xor(hashes, np.uint64(query))
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(diff).astype(np.float64)
+    return np.unpackbits(diff.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1).astype(np.float64)
+
+def resample_trajectory(poses, stop, samples=TRAJECTORY_SAMPLES):
+    ## Frames [0, stop) interpolated to a fixed number of samples, skipping rows with NaN or inf
+    poses = poses[:stop]
+    finite = np.flatnonzero(np.isfinite(poses).all(axis=1))
+    if len(finite) == 0:
+        return None
+    times = np.linspace(0, len(poses) - 1, samples)
+    return np.stack([np.interp(times, finite, poses[finite, column]) for column in range(poses.shape[1])], axis=1).astype(np.float32)
+
+def thumbnail_hash(blob):
+    image = cv2.imdecode(blob, cv2.IMREAD_GRAYSCALE)
+    return None if image is None else perceptual_hash(image)
+
+def thumbnail_hashes(file_name, camera, frames):
+    ## {frame: pHash} from the thumbnail cache, making (and caching) any thumbnail that is missing
+    thumbnails = robros_core.load_thumbnails(file_name, camera, frames)
+    made = robros_core.make_thumbnails(file_name, camera, [frame for frame in frames if frame not in thumbnails])
+    if made:
+        robros_core.save_thumbnails(file_name, camera, made)
+        thumbnails.update(made)
+
+    hashes = {frame: thumbnail_hash(blob) for frame, blob in thumbnails.items()}
+    return {frame: value for frame, value in hashes.items() if value is not None}
+
+def frame_hash(file_name, camera, frame):
+    ## One query frame hashed in memory; the thumbnail cache is read but never written, it only holds indexed keyframes
+    blob = robros_core.load_thumbnails(file_name, camera, [frame]).get(frame)
+    if blob is None:
+        blob = robros_core.make_thumbnails(file_name, camera, [frame]).get(frame)
+    return None if blob is None else thumbnail_hash(blob)
+
+def index_episode(file_name):
+    stat = os.stat(file_name)
+    poses = None
+    with h5py.File(file_name, 'r') as hdf5_file:
+        length = robros_core.episode_length(hdf5_file) or 0
+        cameras = list(hdf5_file['observations/images']) if 'observations/images' in hdf5_file else []
+        if POSE_DATASET in hdf5_file:
+            dataset = hdf5_file[POSE_DATASET]
+            if dataset.dtype.kind in 'biuf' and dataset.ndim >= 1 and dataset.shape[0]:
+                poses = np.asarray(dataset[()], dtype=np.float64).reshape(dataset.shape[0], -1)
+
+    frames = list(range(0, length, frame_stride(length)))
+    arrays = {}
+    if poses is not None:
+        finite = np.isfinite(poses).all(axis=1)
+        pose_frames = np.array([frame for frame in frames if frame < len(poses) and finite[frame]], dtype=np.int32)
+        arrays['pose_frames'] = pose_frames
+        arrays['poses'] = poses[pose_frames].astype(np.float32)
+        for kind, stop in (('trajectory', len(poses)), ('start', min(len(poses), START_FRAMES))):
+            trajectory = resample_trajectory(poses, stop)
+            if trajectory is not None:
+                arrays[kind] = trajectory
+
+    for camera in cameras:
+        hashes = thumbnail_hashes(file_name, camera, frames)
+        arrays[f'hash_frames/{camera}'] = np.array(sorted(hashes), dtype=np.int32)
+        arrays[f'hashes/{camera}'] = np.array([hashes[frame] for frame in sorted(hashes)], dtype=np.uint64)
+
+    return {
+        'name': os.path.basename(file_name),
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'length': length,
+        'cameras': cameras,
+        'arrays': arrays,
+    }
+
+def _index_or_error(file_name):
+    try:
+        return index_episode(file_name)
+    except Exception as e:
+        return {'name': os.path.basename(file_name), 'error': str(e)}
+
+def load_cache(directory):
+    ## {name: entry}; a JSON manifest holds the metadata and each array is stored as "<episode>/<key>"
+    try:
+        with np.load(os.path.join(directory, SEARCH_FILE_NAME)) as cache:
+            manifest = json.loads(str(cache['manifest']))
+            if manifest.get('version') != SEARCH_VERSION:
+                return {}
+            entries = manifest['episodes']
+            for entry in entries.values():
+                entry['arrays'] = {}
+            for member in cache.files:
+                if member == 'manifest':
+                    continue
+                name, key = member.split('/', 1)
+                if name in entries:
+                    entries[name]['arrays'][key] = cache[member]
+            return entries
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def save_cache(directory, entries):
+    cache_path = os.path.join(directory, SEARCH_FILE_NAME)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    manifest = {'version': SEARCH_VERSION, 'episodes': {name: {key: value for key, value in entry.items() if key != 'arrays'} for name, entry in entries.items()}}
+    arrays = {f"{name}/{key}": value for name, entry in entries.items() for key, value in entry['arrays'].items()}
+    try:
+        with open(temp_path, 'wb') as cache_file:
+            np.savez(cache_file, manifest=np.array(json.dumps(manifest)), **arrays)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def index_files(file_names, workers=None, progress=None):
+    ## Returns {path: entry}; entries are cached next to the episodes and reused while the file is unchanged
+    return robros_core.map_cached_episodes(file_names, _index_or_error, load_cache, save_cache, workers=workers, progress=progress)
+
+class SearchIndex:
+    ## Every episode's rows stacked into one array per kind, so a query is a single vectorised pass.
+    ## Poses and trajectories are grouped by width, since episodes with a different object count cannot be compared.
+    def __init__(self, entries):
+        self.files = [path for path, entry in entries.items() if 'error' not in entry]
+        self.failed = {entry['name']: entry['error'] for entry in entries.values() if 'error' in entry}
+        self.entries = {path: entries[path] for path in self.files}
+        self.poses = {}
+        self.hashes = {}
+        self.episodes = {kind: {} for kind in EPISODE_KINDS}
+
+        groups = {}
+        for file_id, path in enumerate(self.files):
+            arrays = self.entries[path]['arrays']
+            if 'poses' in arrays and len(arrays['poses']):
+                groups.setdefault(('poses', arrays['poses'].shape[1]), []).append((arrays['poses'], file_id, arrays['pose_frames']))
+            for kind in EPISODE_KINDS:
+                if kind in arrays:
+                    groups.setdefault((kind, arrays[kind].shape[1]), []).append((arrays[kind].reshape(1, -1), file_id, np.zeros(1, dtype=np.int32)))
+            for camera in self.entries[path]['cameras']:
+                if len(arrays.get(f'hashes/{camera}', ())):
+                    groups.setdefault(('hashes', camera), []).append((arrays[f'hashes/{camera}'], file_id, arrays[f'hash_frames/{camera}']))
+
+        for (kind, group), parts in groups.items():
+            stacked = (
+                np.concatenate([values for values, _, _ in parts]),
+                np.concatenate([np.full(len(frames), file_id, dtype=np.int32) for _, file_id, frames in parts]),
+                np.concatenate([frames for _, _, frames in parts]),
+            )
+            if kind == 'poses':
+                self.poses[group] = stacked
+            elif kind == 'hashes':
+                self.hashes[group] = stacked
+            else:
+                self.episodes[kind][group] = stacked
+
+    def __len__(self):
+        return len(self.files)
+
+    def frame_hash(self, file_name, camera, frame):
+        ## Indexed keyframes reuse their hash while the episode is unchanged, anything else is hashed on the fly
+        entry = self.entries.get(os.path.abspath(file_name))
+        if entry is not None and f'hash_frames/{camera}' in entry['arrays']:
+            stat = os.stat(file_name)
+            frames = entry['arrays'][f'hash_frames/{camera}']
+            position = np.searchsorted(frames, frame)
+            if (entry['mtime'], entry['size']) == (stat.st_mtime, stat.st_size) and position < len(frames) and frames[position] == frame:
+                return entry['arrays'][f'hashes/{camera}'][position]
+        return frame_hash(file_name, camera, frame)
+
+    def nearest_poses(self, pose, limit=DEFAULT_LIMIT, exclude=None, per_episode=True):
+        ## Distance is the RMS difference per xpos coordinate, in the dataset's own units
+        pose = np.asarray(pose, dtype=np.float32).ravel()
+        if pose.size not in self.poses or not np.isfinite(pose).all():
+            return []
+        values, file_ids, frames = self.poses[pose.size]
+        distances = np.sqrt(np.mean((values - pose) ** 2, axis=1))
+        return self._rank(distances, file_ids, frames, limit, exclude, per_episode)
+
+    def similar_frames(self, camera, query_hash, limit=DEFAULT_LIMIT, exclude=None, per_episode=True):
+        ## Distance is the number of differing pHash bits, 0 to 64
+        if camera not in self.hashes or query_hash is None:
+            return []
+        values, file_ids, frames = self.hashes[camera]
+        return self._rank(hamming(values, query_hash), file_ids, frames, limit, exclude, per_episode)
+
+    def similar_episodes(self, file_name, kind='trajectory', limit=DEFAULT_LIMIT, trajectory=None):
+        ## `trajectory` overrides the indexed one, e.g. for an episode outside the index
+        if trajectory is None:
+            trajectory = self.entries.get(os.path.abspath(file_name), {}).get('arrays', {}).get(kind)
+        if trajectory is None or trajectory.shape[1] not in self.episodes[kind]:
+            return []
+        values, file_ids, frames = self.episodes[kind][trajectory.shape[1]]
+        distances = np.sqrt(np.mean((values - trajectory.reshape(1, -1)) ** 2, axis=1))
+        return self._rank(distances, file_ids, frames, limit, file_name, False)
+
+    def _rank(self, distances, file_ids, frames, limit, exclude, per_episode):
+        if exclude is not None and os.path.abspath(exclude) in self.entries:
+            distances = np.where(file_ids == self.files.index(os.path.abspath(exclude)), np.inf, distances)
+        order = np.argsort(distances, kind='stable')
+        order = order[np.isfinite(distances[order])]
+        if per_episode:
+            ## Best frame of each episode, so one long demo cannot fill the whole list
+            _, first = np.unique(file_ids[order], return_index=True)
+            order = order[np.sort(first)]
+        return [{'file': self.files[file_ids[i]], 'frame': int(frames[i]), 'distance': float(distances[i])} for i in order[:limit]]
@@ -0,0 +1,229 @@
+## Description: Streaming statistics across a collection of ROBROS IL episodes, for normalization and dataset review
+
+import os
+import fnmatch
+import h5py
+import numpy as np
+import cv2
+import robros_core
+
+DEFAULT_STAT_DATASETS = ['action*', 'observations/xpos', 'rewards/task']
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+STATS_BLOCK_BYTES = 4 * 1024 * 1024
+LENGTH_HISTOGRAM_BINS = 20
+
+class QuantileSketch:
+    ## Log-bucketed counts per column (DDSketch): quantiles come back within relative_accuracy of the true value,
+    ## memory is fixed, and two sketches merge by adding their counts
+    def __init__(self, columns, relative_accuracy=0.01, min_value=1e-9, max_value=1e12):
+        self.columns = columns
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.min_value = min_value
+        self.buckets = int(np.ceil(np.log(max_value / min_value) / self.log_gamma)) + 1
+        self.positive = np.zeros((columns, self.buckets), dtype=np.int64)
+        self.negative = np.zeros((columns, self.buckets), dtype=np.int64)
+        self.zero = np.zeros(columns, dtype=np.int64)
+
+    def add(self, block):
+        finite = np.isfinite(block)
+        magnitude = np.abs(np.where(finite, block, 0))
+        column_index = np.broadcast_to(np.arange(self.columns), block.shape)
+        self.zero += (finite & (magnitude < self.min_value)).sum(axis=0)
+        for mask, counts in ((finite & (block >= self.min_value), self.positive), (finite & (block <= -self.min_value), self.negative)):
+            bucket = np.ceil(np.log(magnitude[mask] / self.min_value) / self.log_gamma).astype(np.int64)
+            np.clip(bucket, 0, self.buckets - 1, out=bucket)
+            counts += np.bincount(column_index[mask] * self.buckets + bucket, minlength=self.columns * self.buckets).reshape(self.columns, self.buckets)
+
+    def merge(self, other):
+        self.positive += other.positive
+        self.negative += other.negative
+        self.zero += other.zero
+
+    def quantiles(self, qs):
+        ## Bucket i holds values in (min * gamma ** (i - 1), min * gamma ** i], represented by the point with equal relative error to both ends
+        centers = self.min_value * self.gamma ** np.arange(self.buckets) * 2 / (1 + self.gamma)
+        values = np.concatenate((-centers[::-1], [0.0], centers))
+        result = np.full((len(qs), self.columns), np.nan)
+        for column in range(self.columns):
+            counts = np.concatenate((self.negative[column, ::-1], [self.zero[column]], self.positive[column]))
+            total = counts.sum()
+            if total:
+                result[:, column] = values[np.searchsorted(np.cumsum(counts), np.asarray(qs) * (total - 1), side='right')]
+        return result
+
+class StreamingStats:
+    ## Per-column count, mean, variance (Welford, merged block-wise with Chan's formula), min, max and a quantile sketch.
+    ## NaN and inf are counted separately and left out of everything else.
+    def __init__(self, columns):
+        self.columns = columns
+        self.count = np.zeros(columns, dtype=np.int64)
+        self.mean = np.zeros(columns)
+        self.m2 = np.zeros(columns)
+        self.min = np.full(columns, np.inf)
+        self.max = np.full(columns, -np.inf)
+        self.nonfinite = np.zeros(columns, dtype=np.int64)
+        self.sketch = QuantileSketch(columns)
+
+    def update(self, block):
+        block = np.asarray(block, dtype=np.float64).reshape(len(block), -1)
+        if block.shape[1] != self.columns:
+            raise ValueError(f"Expected {self.columns} columns, got {block.shape[1]}")
+        finite = np.isfinite(block)
+        self.nonfinite += (~finite).sum(axis=0)
+
+        count = finite.sum(axis=0)
+        if not count.any():
+            return
+        safe_count = np.maximum(count, 1)
+        mean = np.where(finite, block, 0).sum(axis=0) / safe_count
+        m2 = (np.where(finite, block - mean, 0) ** 2).sum(axis=0)
+        self._combine(count, mean, m2)
+        self.min = np.fmin(self.min, np.where(finite, block, np.inf).min(axis=0))
+        self.max = np.fmax(self.max, np.where(finite, block, -np.inf).max(axis=0))
+        self.sketch.add(block)
+
+    def merge(self, other):
+        if other.columns != self.columns:
+            raise ValueError(f"Expected {self.columns} columns, got {other.columns}")
+        self._combine(other.count, other.mean, other.m2)
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self.nonfinite += other.nonfinite
+        self.sketch.merge(other.sketch)
+
+    def summary(self, qs=QUANTILES):
+        empty = self.count == 0
+        clean = lambda values: [None if flag else float(value) for value, flag in zip(values, empty)]
+        ## Sketch buckets are ~1% wide, so the extremes are clamped to the exact min and max
+        quantiles = np.clip(self.sketch.quantiles(qs), self.min, self.max)
+        return {
+            'count': self.count.tolist(),
+            'nonfinite': self.nonfinite.tolist(),
+            'mean': clean(self.mean),
+            'std': clean(np.sqrt(self.m2 / np.maximum(self.count, 1))),
+            'min': clean(self.min),
+            'max': clean(self.max),
+            'quantiles': {f"p{q * 100:g}": clean(values) for q, values in zip(qs, quantiles)},
+        }
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        safe_total = np.maximum(total, 1)
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / safe_total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / safe_total
+        self.count = total
+
+def select_stat_datasets(hdf5_file, patterns):
+    ## Numeric datasets matching the glob patterns; trailing dimensions are flattened into columns
+    selected = []
+    for dataset_path in robros_core.list_datasets(hdf5_file):
+        dataset = hdf5_file[dataset_path]
+        if dataset.dtype.kind in 'biuf' and dataset.ndim >= 1 and dataset.shape[0] and any(fnmatch.fnmatchcase(dataset_path, pattern) for pattern in patterns):
+            selected.append(dataset_path)
+    return selected
+
+def episode_stats(file_name, patterns=None, image_stride=10):
+    ## One episode's accumulators; reads a single chunk (or STATS_BLOCK_BYTES of rows when contiguous) at a time
+    stats = {}
+    with h5py.File(file_name, 'r') as hdf5_file:
+        for dataset_path in select_stat_datasets(hdf5_file, patterns or DEFAULT_STAT_DATASETS):
+            dataset = hdf5_file[dataset_path]
+            columns = int(np.prod(dataset.shape[1:], dtype=np.int64))
+            if dataset.chunks is not None:
+                block_rows = dataset.chunks[0]
+            else:
+                block_rows = max(1, STATS_BLOCK_BYTES // max(1, dataset.dtype.itemsize * columns))
+            stats[dataset_path] = StreamingStats(columns)
+            for offset in range(0, dataset.shape[0], block_rows):
+                stats[dataset_path].update(dataset[offset:offset + block_rows])
+
+        brightness = {}
+        undecodable = {}
+        if image_stride and 'observations/images' in hdf5_file:
+            for key, dataset in hdf5_file['observations/images'].items():
+                if dataset.dtype.kind != 'O':
+                    continue
+                ## Mean luma of a 1/8 scale grayscale decode is plenty for exposure statistics
+                values = []
+                undecodable[key] = 0
+                for frame_index in range(0, dataset.shape[0], image_stride):
+                    image = cv2.imdecode(np.frombuffer(dataset[frame_index], dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+                    if image is None:
+                        undecodable[key] += 1
+                    else:
+                        values.append(image.mean())
+                brightness[key] = StreamingStats(1)
+                if values:
+                    brightness[key].update(np.array(values)[:, None])
+
+        length = robros_core.episode_length(hdf5_file)
+
+    return {'length': length, 'datasets': stats, 'brightness': brightness, 'undecodable': undecodable}
+
+def _episode_stats_or_error(file_name, patterns, image_stride):
+    try:
+        return episode_stats(file_name, patterns, image_stride)
+    except Exception as e:
+        return {'error': str(e)}
+
+def compute_stats(file_names, patterns=None, image_stride=10, workers=None, progress=None):
+    ## Episodes are reduced in a process pool and merged here as they finish; progress(done, total) returning False cancels
+    file_names = list(dict.fromkeys(os.path.abspath(file_name) for file_name in file_names))
+    datasets = {}
+    brightness = {}
+    undecodable = {}
+    lengths = {}
+    failed = {}
+
+    def merge(file_name, result):
+        if 'error' in result:
+            failed[os.path.basename(file_name)] = result['error']
+            return
+        try:
+            for target, parts in ((datasets, result['datasets']), (brightness, result['brightness'])):
+                for key, part in parts.items():
+                    if key in target and target[key].columns != part.columns:
+                        raise ValueError(f"'{key}' has {part.columns} columns, earlier episodes have {target[key].columns}")
+            for target, parts in ((datasets, result['datasets']), (brightness, result['brightness'])):
+                for key, part in parts.items():
+                    if key in target:
+                        target[key].merge(part)
+                    else:
+                        target[key] = part
+        except ValueError as e:
+            failed[os.path.basename(file_name)] = str(e)
+            return
+        for key, count in result['undecodable'].items():
+            undecodable[key] = undecodable.get(key, 0) + count
+        if result['length'] is not None:
+            lengths[os.path.basename(file_name)] = result['length']
+
+    robros_core.map_episodes(file_names, _episode_stats_or_error, (patterns, image_stride), workers, progress, merge)
+
+    return build_report(datasets, brightness, undecodable, lengths, failed, patterns or DEFAULT_STAT_DATASETS)
+
+def build_report(datasets, brightness, undecodable, lengths, failed, patterns):
+    length_values = np.array(list(lengths.values()), dtype=np.float64)
+    length_report = None
+    if len(length_values):
+        counts, edges = np.histogram(length_values, bins=min(LENGTH_HISTOGRAM_BINS, max(1, len(np.unique(length_values)))))
+        length_report = {
+            'min': int(length_values.min()),
+            'max': int(length_values.max()),
+            'mean': float(length_values.mean()),
+            'std': float(length_values.std()),
+            'total': int(length_values.sum()),
+            'histogram': {'counts': counts.tolist(), 'edges': edges.tolist()},
+            'episodes': lengths,
+        }
+
+    return {
+        'episodes': len(lengths),
+        'patterns': list(patterns),
+        'failed': failed,
+        'length': length_report,
+        'datasets': {key: stats.summary() for key, stats in sorted(datasets.items())},
+        'brightness': {key: dict(stats.summary(), undecodable=undecodable.get(key, 0)) for key, stats in sorted(brightness.items())},
+    }
@@ -0,0 +1,284 @@
+## Description: Tests for the GUI-free modules on small synthetic episodes from robros_bench
+
+import os
+import json
+import h5py
+import numpy as np
+import cv2
+import pytest
+import robros_batch
+import robros_bench
+import robros_core
+import robros_qc
+import robros_search
+import robros_stats
+
+FRAMES = 40
+
+def read_all(path):
+    ## {dataset path: list of blobs or a numpy array}
+    data = {}
+    with h5py.File(path, 'r') as hdf5_file:
+        for dataset_path in robros_core.list_datasets(hdf5_file):
+            dataset = hdf5_file[dataset_path]
+            data[dataset_path] = [bytes(blob) for blob in dataset[()]] if dataset.dtype.kind == 'O' else dataset[()]
+    return data
+
+def shorten_camera(path, camera, length):
+    with h5py.File(path, 'a') as hdf5_file:
+        blobs = hdf5_file[f'observations/images/{camera}'][:length]
+        del hdf5_file[f'observations/images/{camera}']
+        dataset = hdf5_file['observations/images'].create_dataset(camera, (length,), dtype=h5py.vlen_dtype(np.uint8), chunks=(8,))
+        robros_core.write_vlen_rows(dataset, 0, blobs)
+
+@pytest.fixture
+def episode(tmp_path):
+    return robros_bench.generate_episode(str(tmp_path / 'episode.hdf5'), cameras=2, width=64, height=48, frames=FRAMES, chunk_frames=8)
+
+def test_trim_keeps_the_selected_frames(episode, tmp_path):
+    output = str(tmp_path / 'trimmed.hdf5')
+    result = robros_core.edit_episode(episode, output, {'frames': [5, 25]})
+    source = read_all(episode)
+    trimmed = read_all(output)
+    assert result['missing'] == []
+    assert set(trimmed) == set(source)
+    for dataset_path, values in trimmed.items():
+        assert len(values) == 20
+        if isinstance(values, list):
+            assert values == source[dataset_path][5:25]
+        else:
+            np.testing.assert_array_equal(values, source[dataset_path][5:25])
+
+def test_split_ranges_cover_the_episode(episode, tmp_path):
+    ranges = robros_core.split_ranges(0, FRAMES, [25, 10, 10, 0, FRAMES])
+    assert ranges == [[0, 10], [10, 25], [25, FRAMES]]
+    parts = []
+    for i, frame_range in enumerate(ranges):
+        output = str(tmp_path / f'part_{i}.hdf5')
+        robros_core.edit_episode(episode, output, {'frames': frame_range})
+        parts.append(read_all(output))
+    source = read_all(episode)
+    np.testing.assert_array_equal(np.concatenate([part['observations/xpos'] for part in parts]), source['observations/xpos'])
+    assert sum((part['observations/images/cam_1'] for part in parts), []) == source['observations/images/cam_1']
+
+def test_trim_cuts_mismatched_cameras_to_the_same_frames(episode, tmp_path):
+    shorten_camera(episode, 'cam_1', 30)
+    output = str(tmp_path / 'trimmed.hdf5')
+    robros_core.edit_episode(episode, output, {'frames': [5, 25]})
+    with h5py.File(output, 'r') as hdf5_file:
+        assert {dataset_path: hdf5_file[dataset_path].shape[0] for dataset_path in robros_core.list_datasets(hdf5_file)} == dict.fromkeys(
+            ['action', 'observations/images/cam_0', 'observations/images/cam_1', 'observations/xpos', 'rewards/task'], 20)
+
+    with h5py.File(episode, 'a') as hdf5_file:
+        ## A third camera makes 40 frames the common length, so 20:40 runs past cam_1
+        hdf5_file.copy('observations/images/cam_0', 'observations/images/cam_2')
+    with pytest.raises(ValueError, match="cam_1"):
+        robros_core.edit_episode(episode, output, {'frames': [20, 40]})
+
+@pytest.mark.parametrize('spec', [{'frames': [100, None]}, {'frames': [10, 10]}, {'frames': [100, None], 'recompress': {'codec': 'jpeg'}}])
+def test_empty_frame_range_is_refused(episode, tmp_path, spec):
+    with pytest.raises(ValueError, match="selects no frames"):
+        robros_core.edit_episode(episode, str(tmp_path / 'out.hdf5'), spec)
+    assert not os.path.exists(tmp_path / 'out.hdf5')
+
+def test_parse_frame_range():
+    assert robros_core.parse_frame_range('5:') == [5, None]
+    assert robros_core.parse_frame_range(':-3') == [None, -3]
+    assert robros_core.parse_frame_range('-10:5') == [-10, 5]
+    for text in ('30:10', '4:4', '-2:-5', '5', 'a:b'):
+        with pytest.raises(ValueError):
+            robros_core.parse_frame_range(text)
+
+def test_in_place_save(episode):
+    source = read_all(episode)
+    robros_core.edit_episode(episode, episode, {'drop': ['action']})
+    saved = read_all(episode)
+    assert set(saved) == set(source) - {'action'}
+    np.testing.assert_array_equal(saved['observations/xpos'], source['observations/xpos'])
+    assert saved['observations/images/cam_0'] == source['observations/images/cam_0']
+    assert os.listdir(os.path.dirname(episode)) == ['episode.hdf5']
+
+def test_recompress(episode, tmp_path):
+    output = str(tmp_path / 'small.hdf5')
+    spec = {'recompress': {'codec': 'jpeg', 'quality': 50, 'max_size': [32, 24], 'compression': 'gzip', 'threads': 2}}
+    result = robros_core.edit_episode(episode, output, spec)
+    assert result['frames_encoded'] == 2 * FRAMES
+    assert result['frames_failed'] == 0
+    with h5py.File(episode, 'r') as source_file, h5py.File(output, 'r') as output_file:
+        for camera in ('cam_0', 'cam_1'):
+            images = output_file[f'observations/images/{camera}']
+            assert images.shape == (FRAMES,)
+            assert robros_core.read_image_shape(images)[:2] == (24, 32)
+            assert cv2.imdecode(images[FRAMES - 1], cv2.IMREAD_COLOR).shape == (24, 32, 3)
+        assert output_file['observations/xpos'].compression == 'gzip'
+        np.testing.assert_array_equal(output_file['observations/xpos'][()], source_file['observations/xpos'][()])
+
+def test_lazy_array_matches_h5py(tmp_path):
+    for chunk_frames in (8, 0):
+        path = robros_bench.generate_episode(str(tmp_path / f'episode_{chunk_frames}.hdf5'), cameras=1, width=32, height=24, frames=100, chunk_frames=chunk_frames)
+        with h5py.File(path, 'r') as hdf5_file:
+            dataset = hdf5_file['observations/xpos']
+            lazy = robros_core.LazyArray(dataset, cache_chunks=4)
+            assert len(lazy) == 100
+            for key in (0, 7, 99, -1, slice(3, 21), slice(0, 100), slice(90, None), slice(5, 60, 3), (12, slice(0, 3)), (slice(10, 20), 4)):
+                np.testing.assert_array_equal(lazy[key], dataset[key])
+            with pytest.raises(IndexError):
+                lazy[100]
+            lazy.close()
+
+def test_min_max_pyramid_query():
+    data = np.random.default_rng(0).normal(size=10001).astype(np.float32)
+    pyramid = robros_core.MinMaxPyramid.build(data, block_rows=1000)
+    assert pyramid.query(0, 100, 100) is None
+
+    x, y = pyramid.query(1000, 9000, 100)
+    bucket = int(round(x[2] - x[0]))
+    assert bucket >= 2
+    for center, low, high in zip(x[0::2], y[0::2], y[1::2]):
+        first = int(center - (bucket - 1) / 2)
+        window = data[first:first + bucket]
+        assert (low, high) == (window.min(), window.max())
+    assert y.min() <= data[1000:9000].min() and y.max() >= data[1000:9000].max()
+
+def test_streaming_stats_merge_matches_numpy():
+    rng = np.random.default_rng(1)
+    data = rng.normal(3, 2, (5000, 3))
+    data[::97, 1] = np.nan
+    whole = robros_stats.StreamingStats(3)
+    parts = [robros_stats.StreamingStats(3) for _ in range(3)]
+    for i, offset in enumerate(range(0, len(data), 700)):
+        whole.update(data[offset:offset + 700])
+        parts[i % 3].update(data[offset:offset + 700])
+    merged = parts[0]
+    merged.merge(parts[1])
+    merged.merge(parts[2])
+
+    for summary in (whole.summary(), merged.summary()):
+        assert summary['count'] == np.isfinite(data).sum(axis=0).tolist()
+        assert summary['nonfinite'] == (~np.isfinite(data)).sum(axis=0).tolist()
+        np.testing.assert_allclose(summary['mean'], np.nanmean(data, axis=0))
+        np.testing.assert_allclose(summary['std'], np.nanstd(data, axis=0))
+        np.testing.assert_array_equal(summary['min'], np.nanmin(data, axis=0))
+        np.testing.assert_array_equal(summary['max'], np.nanmax(data, axis=0))
+        np.testing.assert_allclose(summary['quantiles']['p50'], np.nanmedian(data, axis=0), rtol=0.02)
+
+    with pytest.raises(ValueError):
+        merged.merge(robros_stats.StreamingStats(2))
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+def test_playback_clock_position():
+    clock = FakeClock()
+    playback = robros_core.PlaybackClock(rate=30.0, clock=clock)
+    playback.start(0, 1)
+    clock.now += 1.0
+    assert playback.position() == 30
+    playback.start(0, -1)
+    clock.now += 0.5
+    assert playback.position() == -15
+
+    ## Changing speed keeps the position reached so far and only changes how fast it moves from there
+    playback.start(0, 1)
+    clock.now += 1.0
+    playback.set_rate(speed=2.0)
+    assert playback.position() == 30
+    clock.now += 1.0
+    assert playback.position() == 90
+    playback.set_rate(speed=0.5)
+    clock.now += 2.0
+    assert playback.position() == 120
+
+def test_playback_clock_dropped_and_fps():
+    clock = FakeClock()
+    playback = robros_core.PlaybackClock(rate=30.0, clock=clock)
+    playback.start(0, 1)
+    assert playback.fps() == 0.0
+    for step in (1, 3, -2, 1, 1):
+        clock.now += 0.1
+        playback.presented(step)
+    assert playback.dropped == 3
+    assert playback.fps() == pytest.approx(10.0)
+    ## Presenting at 10 fps while the clock runs at 30 means about 3 frames per presented frame
+    assert playback.expected_step(0.005) == pytest.approx(3.0)
+
+    playback.start(0, 1)
+    assert playback.dropped == 0 and playback.fps() == 0.0
+
+def test_quality_check_finds_a_truncated_frame(episode):
+    with h5py.File(episode, 'a') as hdf5_file:
+        dataset = hdf5_file['observations/images/cam_0']
+        robros_core.write_vlen_rows(dataset, 3, [dataset[3][:len(dataset[3]) // 2]])
+    entry = robros_qc.check_episode(episode, frozen_frames=0)
+    assert entry['status'] == 'error'
+    assert [(found['check'], found['dataset'], found['frames']) for found in entry['issues'] if found['check'] == 'undecodable'] == [
+        ('undecodable', 'observations/images/cam_0', [3])]
+
+def test_search_finds_the_query_first(tmp_path):
+    paths = [robros_bench.generate_episode(str(tmp_path / f'episode_{i}.hdf5'), cameras=1, width=64, height=48, frames=FRAMES, seed=i) for i in range(2)]
+    index = robros_search.SearchIndex(robros_search.index_files([paths[0]]) | robros_search.index_files([paths[1]]))
+    assert len(index) == 2
+    with h5py.File(paths[1], 'r') as hdf5_file:
+        pose = hdf5_file['observations/xpos'][17]
+    hits = index.nearest_poses(pose, per_episode=False)
+    assert (hits[0]['file'], hits[0]['frame'], hits[0]['distance']) == (os.path.abspath(paths[1]), 17, 0.0)
+    assert index.nearest_poses(pose, exclude=paths[1])[0]['file'] == os.path.abspath(paths[0])
+
+    query_hash = index.frame_hash(paths[0], 'cam_0', 5)
+    assert index.similar_frames('cam_0', query_hash, per_episode=False)[0]['distance'] == 0
+    assert index.similar_episodes(paths[0])[0]['file'] == os.path.abspath(paths[1])
+
+def touch(path, seconds=10):
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime + seconds, stat.st_mtime + seconds))
+
+def test_scan_files_reuses_the_index(tmp_path):
+    paths = [robros_bench.generate_episode(str(tmp_path / f'episode_{i}.hdf5'), cameras=1, width=32, height=24, frames=FRAMES, seed=i) for i in range(2)]
+    assert [entry['data_count'] for entry in robros_core.scan_files(paths).values()] == [FRAMES, FRAMES]
+
+    ## Mark both cached entries, so a result read back from the index is told apart from a rescan
+    index_path = tmp_path / robros_core.INDEX_FILE_NAME
+    index = json.loads(index_path.read_text())
+    for entry in index['episodes'].values():
+        entry['data_count'] = -1
+    index_path.write_text(json.dumps(index))
+    touch(paths[1])
+
+    infos = robros_core.scan_files(paths)
+    assert [infos[os.path.abspath(path)]['data_count'] for path in paths] == [-1, FRAMES]
+    assert json.loads(index_path.read_text())['episodes']['episode_1.hdf5']['data_count'] == FRAMES
+
+def test_batch_edit_resumes_from_the_journal(tmp_path):
+    input_dir = tmp_path / 'input'
+    output_dir = tmp_path / 'output'
+    input_dir.mkdir()
+    for i in range(2):
+        robros_bench.generate_episode(str(input_dir / f'episode_{i}.hdf5'), cameras=1, width=32, height=24, frames=FRAMES, seed=i)
+    spec = {'drop': ['action']}
+
+    def run(directory, spec, restart=False):
+        report = robros_batch.run_edit(str(input_dir), str(directory), spec, workers=1, restart=restart, log=lambda message: None)
+        assert report == json.loads((directory / robros_batch.REPORT_FILE_NAME).read_text())
+        assert report['failed'] == [] and report['episodes'] == 2
+        return report['edited'], report['skipped']
+
+    assert run(output_dir, spec) == (2, 0)
+    report = json.loads((output_dir / robros_batch.REPORT_FILE_NAME).read_text())
+    assert report['bytes_in'] > report['bytes_out'] > 0 and report['missing_datasets'] == {}
+    assert sorted(read_all(str(output_dir / 'episode_0.hdf5'))) == sorted(set(read_all(str(input_dir / 'episode_0.hdf5'))) - {'action'})
+
+    assert run(output_dir, spec) == (0, 2)
+    assert run(output_dir, spec, restart=True) == (2, 0)
+    assert run(output_dir, {'drop': ['action', 'rewards/task']}) == (2, 0)
+    touch(str(output_dir / 'episode_1.hdf5'))
+    assert run(output_dir, {'drop': ['action', 'rewards/task']}) == (1, 1)
+
+    ## In place the source is the rewritten output, so the journal must accept the output's stat for it
+    assert run(input_dir, spec) == (2, 0)
+    assert run(input_dir, spec) == (0, 2)
+    touch(str(input_dir / 'episode_0.hdf5'))
+    assert run(input_dir, spec) == (1, 1)